@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# compares the playlist parser backends (time + peak memory) on saved playlist pages:
+#     python3 benchmarks/playlist_parsers.py saved_playlist_1.html saved_playlist_2.html ...
+# without arguments a synthetic 200 entry page in the (old) layout of youtube.com/playlist is used
+# NOTE: tracemalloc only sees Python's allocations, libxml2's own ones are missing from lxml's peak memory
+import os.path
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, "src"))
+
+from playlist import CHUNK_SIZE, PARSERS  # noqa: E402
+
+REPEATS = 5
+
+
+def synthetic_page(entries=200):
+    rows = []
+    for index in range(entries):
+        rows.append("<tr class=\"pl-video yt-uix-tile \" data-video-id=\"video" + str(index).zfill(6) + "\">"
+                    "<td class=\"pl-video-handle \"><span class=\"pl-video-index\">" + str(index + 1) + "</span></td>"
+                    "<td class=\"pl-video-thumbnail\"><span class=\"yt-thumb-clip\"><img width=\"72\" "
+                    "data-thumb=\"https://i.ytimg.com/vi/video" + str(index).zfill(6) + "/hqdefault.jpg\" "
+                    "src=\"/yts/img/pixel.gif\" alt=\"\"></span></td>"
+                    "<td class=\"pl-video-title\"><a class=\"pl-video-title-link yt-uix-tile-link "
+                    "yt-uix-sessionlink  spf-link \" dir=\"ltr\" href=\"/watch?v=video" + str(index).zfill(6) +
+                    "&amp;list=PLbenchmark&amp;index=" + str(index + 1) + "\" data-sessionlink=\"ei=abc\">\n"
+                    "      Video number " + str(index + 1) + " &amp; some more title\n    </a>"
+                    "<div class=\"pl-video-owner\">by <a href=\"/channel/UCbenchmark\" class=\" yt-uix-sessionlink "
+                    "spf-link \">Uploader</a></div></td>"
+                    "<td class=\"pl-video-time\"><div class=\"timestamp\"><span>4:20</span></div></td></tr>\n")
+    script = "<script>var ytInitialData = {\"padding\": \"" + "x" * 200000 + "\"};</script>"
+    return ("<!DOCTYPE html><html><head><title>Benchmark playlist</title>" + script + "</head><body>"
+            "<table id=\"pl-video-table\"><tbody id=\"pl-load-more-destination\">" + "".join(rows) +
+            "</tbody></table><button class=\"yt-uix-button browse-items-load-more-button\" "
+            "data-uix-load-more-href=\"/browse_ajax?action_continuation=1&amp;continuation=token\">Load more"
+            "</button></body></html>")
+
+
+def parse(parser_class, page_html):
+    # fed chunk by chunk, just like iter_playlist does it
+    parser = parser_class()
+    for start in range(0, len(page_html), CHUNK_SIZE):
+        parser.feed(page_html[start:start + CHUNK_SIZE])
+    parser.close()
+    return parser
+
+
+def benchmark(name, parser_class, page_html):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        parser = parse(parser_class, page_html)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    parse(parser_class, page_html)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print("  " + name.ljust(12) + str(round(min(times) * 1000, 2)).rjust(10) + " ms" +
+          str(round(peak / 1024 / 1024, 2)).rjust(10) + " MB" + str(len(parser.videos)).rjust(8) + " videos" +
+          ("  (continuation found)" if parser.continuation else ""))
+
+
+def main(paths):
+    pages = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as page_file:
+            pages.append((path, page_file.read()))
+    if not pages:
+        pages.append(("synthetic page", synthetic_page()))
+
+    for path, page_html in pages:
+        print(path + " (" + str(len(page_html) // 1024) + " KB), best of " + str(REPEATS) + ", peak memory:")
+        for name, parser_class in PARSERS.items():
+            if parser_class:
+                benchmark(name, parser_class, page_html)
+            else:
+                print("  " + name.ljust(12) + "not installed")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
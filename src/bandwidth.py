@@ -0,0 +1,121 @@
+import datetime
+import re
+import threading
+import time
+
+
+class TokenBucket:
+    # a chunk may go as soon as the bucket isn't in debt anymore, the debt it leaves behind is paid by the next
+    # one waiting -> one lock round trip per chunk and the long-term throughput is exactly the rate
+    burst_time = 0.25
+
+    def __init__(self, rate=0):
+        # bytes per second, 0: unlimited
+        self.rate = rate
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+
+    def refill(self, now):
+        if self.rate:
+            self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.rate * self.burst_time)
+        self.updated = now
+
+    def set_rate(self, rate):
+        with self.condition:
+            self.refill(time.monotonic())
+            self.rate = rate or 0
+            # waiting ones recalculate their wait with the new rate (or just go if it's unlimited now)
+            self.condition.notify_all()
+
+    def consume(self, size):
+        if not self.rate:
+            return
+        with self.condition:
+            while self.rate:
+                self.refill(time.monotonic())
+                if self.tokens >= 0:
+                    self.tokens -= size
+                    return
+                self.condition.wait(-self.tokens / self.rate)
+
+
+class Throttle:
+    # one per transfer: its own cap (if any) first, then the shared one
+    def __init__(self, scheduler, rate=0):
+        self.scheduler = scheduler
+        self.bucket = TokenBucket(rate)
+
+    def set_rate(self, rate):
+        self.bucket.set_rate(rate)
+
+    def __call__(self, size):
+        self.bucket.consume(size)
+        self.scheduler.consume(size)
+
+
+class BandwidthScheduler:
+    # the schedule is looked at while consuming, not more often than this
+    check_interval = 10
+
+    def __init__(self, rate=0, schedule=()):
+        self.bucket = TokenBucket()
+        self.default_rate = rate
+        self.schedule = list(schedule)
+        self.checked = 0
+        self.update()
+
+    def set_rate(self, rate):
+        self.default_rate = rate
+        self.update()
+
+    def set_schedule(self, schedule):
+        self.schedule = list(schedule)
+        self.update()
+
+    def current_rate(self, now=None):
+        now = now or datetime.datetime.now().time()
+        for start, end, rate in self.schedule:
+            # windows can wrap around midnight (22:00-06:00)
+            if (start <= now < end) if start <= end else (now >= start or now < end):
+                return rate
+        return self.default_rate
+
+    def update(self):
+        self.checked = time.monotonic()
+        rate = self.current_rate()
+        if rate != self.bucket.rate:
+            self.bucket.set_rate(rate)
+
+    def consume(self, size):
+        if self.schedule and time.monotonic() - self.checked > self.check_interval:
+            self.update()
+        self.bucket.consume(size)
+
+    def throttle(self, rate=0):
+        return Throttle(self, rate)
+
+
+def parse_schedule(text):
+    # "08:00-18:00=500, 22:00-06:00=0" (KB/s, 0: unlimited) -> [(start, end, bytes per second)]
+    schedule = []
+    for entry in filter(None, (entry.strip() for entry in text.split(","))):
+        match = re.match(r"^(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(\d+)$", entry)
+        if not match:
+            raise ValueError("Invalid schedule entry \"" + entry + "\", expected something like 08:00-18:00=500.")
+        start_hour, start_minute, end_hour, end_minute, rate = (int(group) for group in match.groups())
+        schedule.append((datetime.time(start_hour, start_minute), datetime.time(end_hour % 24, end_minute),
+                         rate * 1024))
+    return schedule
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = BandwidthScheduler()
+        return _scheduler
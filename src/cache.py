@@ -0,0 +1,94 @@
+import json
+import sqlite3
+import threading
+import time
+
+import pytube
+import pytube.extract
+
+from config import CACHE_FILE
+from streams import StreamInfo, stream_info, url_parameter
+
+
+class MetadataCache:
+    max_entries = 2000
+    default_ttl = 6 * 60 * 60
+    # don't hand out urls that expire while (or right before) we download them
+    expiry_margin = 15 * 60
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS videos ("
+                                    "video_id TEXT PRIMARY KEY, "
+                                    "title TEXT, "
+                                    "streams TEXT NOT NULL, "
+                                    "fetched REAL, "
+                                    "expires REAL, "
+                                    "accessed REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS videos_accessed ON videos (accessed)")
+
+    def get(self, video_id):
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT title, streams FROM videos WHERE video_id = ? AND expires > ?",
+                                          (video_id, now)).fetchone()
+            if not row:
+                return None
+            self.connection.execute("UPDATE videos SET accessed = ? WHERE video_id = ?", (now, video_id))
+        title, streams = row
+        return title, [StreamInfo(*stream) for stream in json.loads(streams)]
+
+    def put(self, video_id, title, streams):
+        now = time.time()
+        expiry_times = [int(url_parameter(stream.url, "expire") or 0) for stream in streams]
+        expires = min(expiry_times) - self.expiry_margin if all(expiry_times) else now + self.default_ttl
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?)",
+                                    (video_id, title, json.dumps([list(stream) for stream in streams]),
+                                     now, expires, now))
+            # least recently used ones (and everything expired) go first
+            self.connection.execute("DELETE FROM videos WHERE expires <= ? OR video_id NOT IN "
+                                    "(SELECT video_id FROM videos ORDER BY accessed DESC LIMIT ?)",
+                                    (now, self.max_entries))
+
+    def resolve(self, url):
+        video_id = pytube.extract.video_id(url)
+        cached = self.get(video_id)
+        if cached:
+            return cached
+
+        yt = pytube.YouTube(url)
+        title = yt.title
+        streams = [stream_info(stream, title) for stream in yt.streams.all()]
+        if streams:
+            self.put(video_id, title, streams)
+        return title, streams
+
+    def streams(self, url, progressive=True):
+        # same order as pytube's streams.filter(progressive=True).desc().all(), progressive=None -> all of them
+        title, streams = self.resolve(url)
+        return [stream for stream in reversed(streams) if progressive is None or stream.is_progressive == progressive]
+
+    def invalidate(self, video_id):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
+
+    def forget(self, url):
+        # e.g. once its stream urls turned out to be expired already
+        self.invalidate(pytube.extract.video_id(url))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MetadataCache(CACHE_FILE)
+        return _cache
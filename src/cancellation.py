@@ -0,0 +1,49 @@
+import threading
+
+
+class CancelledError(Exception):
+    pass
+
+
+class CancelToken:
+    # checked once per chunk by every transfer: cheap while nothing happens, raises once cancelled, blocks
+    # while paused; a child token (one job) also stops when its parent (all jobs) does
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.cancelled = threading.Event()
+        self.running = threading.Event()
+        self.running.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        # paused ones have to wake up to notice
+        self.running.set()
+
+    def pause(self):
+        if not self.cancelled.is_set():
+            self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def is_cancelled(self):
+        return self.cancelled.is_set() or bool(self.parent and self.parent.is_cancelled())
+
+    def is_paused(self):
+        return not self.running.is_set() or bool(self.parent and self.parent.is_paused())
+
+    def interrupted(self):
+        return self.is_cancelled() or self.is_paused()
+
+    def wait(self):
+        # returns right away unless paused (then it blocks until resumed), raises once cancelled
+        while True:
+            token = self
+            while token:
+                token.running.wait()
+                if token.cancelled.is_set():
+                    raise CancelledError("Cancelled.")
+                token = token.parent
+            # the child might have been paused again while we waited for the parent
+            if not self.interrupted():
+                return
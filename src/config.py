@@ -12,6 +12,8 @@ else:
     EXE = [sys.executable, FILE]
 
 APP_PATH = os.path.dirname(FILE)
+JOBS_FILE = os.path.join(APP_PATH, "yt-dl_jobs.sqlite")
+CACHE_FILE = os.path.join(APP_PATH, "yt-dl_cache.sqlite")
 
 ZIP_URL = "https://github.com/FranzPio/yt-dl/zipball/master/"
 GITHUB_URL = "https://github.com/FranzPio/yt-dl"
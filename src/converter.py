@@ -1,11 +1,17 @@
-import collections.abc
+import collections
+import functools
 import os
+import re
 import shutil
 import subprocess
 import sys
+import tempfile
+import threading
 
 from PyQt5 import QtCore, QtWidgets
 
+from workers import POOL_SIZES, get_pool
+
 
 class FFmpegError(Exception):
     pass
@@ -15,6 +21,10 @@ class FFmpegNotFoundError(FFmpegError):
     pass
 
 
+class ConversionCancelledError(FFmpegError):
+    pass
+
+
 class FFprobeError(Exception):
     pass
 
@@ -29,54 +39,371 @@ class FFmpeg(QtCore.QObject):
                                       ("vorbis", ".ogg"),
                                       ("opus", ".opus"),
                                       ("mp3", ".mp3")])
+    # pytube's (RFC 6381) codec names -> ffprobe's
+    stream_codecs = {"mp4a": "aac"}
+    encoders = {"aac": "aac",
+                "vorbis": "libvorbis",
+                "opus": "libopus",
+                "mp3": "libmp3lame"}
 
     finished = QtCore.pyqtSignal()
     success = QtCore.pyqtSignal()
     error = QtCore.pyqtSignal(str, str, int, tuple, bool)
+    # seconds done, seconds total (0: unknown), speed (x realtime), eta in seconds (-1: unknown)
+    progress = QtCore.pyqtSignal(float, float, float, float)
 
-    def __init__(self, path):
+    def __init__(self, path, audio_codec=None):
         super().__init__()
         self.path = os.path.normpath(path)
 
         self.ffmpeg = shutil.which("ffmpeg") or None
         self.ffprobe = shutil.which("ffprobe") or None
 
-        self.audio_codec = None
+        # audio_codec: from the stream's metadata (e.g. "mp4a.40.2"), saves probing the file
+        self.audio_codec = codec_name(audio_codec)
         self.file_ext = None
 
-    def convert_audio(self):
-        pass
+        self.process = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def run(self, args):
+        # one process at a time, cancel() kills whatever's running
+        with self.lock:
+            if self.cancelled:
+                raise ConversionCancelledError("Conversion of " + self.path + " was cancelled.")
+            self.process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = self.process.communicate()
+        if self.cancelled:
+            raise ConversionCancelledError("Conversion of " + self.path + " was cancelled.")
+        return self.process.returncode, stdout, stderr
+
+    def run_ffmpeg(self, args):
+        if not self.ffmpeg:
+            raise FFmpegNotFoundError("Couldn't find ffmpeg. Make sure it's installed and in your PATH.")
+        returncode, stdout, stderr = self.run([self.ffmpeg, "-v", "error", "-y"] + args)
+        if returncode:
+            raise FFmpegError(stderr.decode("utf-8", "replace").strip() or
+                              "ffmpeg exited with code " + str(returncode))
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.process and self.process.poll() is None:
+                self.process.kill()
+
+    def convert_audio(self, codec="mp3", bitrate=None, source=None, duration=None):
+        # re-encodes (unlike extract()); source: writes the input into the file object it gets (ffmpeg's stdin)
+        # instead of ffmpeg reading self.path, e.g. a download that's still running -> converting starts with the
+        # first chunk
+        if codec not in self.encoders:
+            raise FFmpegError("Audio codec \"" + str(codec) + "\" isn't supported.")
+        if not self.ffmpeg:
+            raise FFmpegNotFoundError("Couldn't find ffmpeg. Make sure it's installed and in your PATH.")
+        if duration is None and source is None:
+            duration = self.get_duration()
+
+        output = os.path.splitext(self.path)[0] + self.codecs[codec]
+        args = [self.ffmpeg, "-v", "error", "-y", "-nostats", "-progress", "pipe:1",
+                "-i", "pipe:0" if source else self.path,
+                "-vn",
+                "-c:a", self.encoders[codec]]
+        if bitrate:
+            args += ["-b:a", str(bitrate)]
+        errors = []
+        # stderr goes to a file: a full stderr pipe nobody reads while we read stdout would block both of us
+        with tempfile.TemporaryFile() as stderr_file:
+            with self.lock:
+                if self.cancelled:
+                    raise ConversionCancelledError("Conversion of " + self.path + " was cancelled.")
+                self.process = subprocess.Popen(args + [output],
+                                                stdin=subprocess.PIPE if source else subprocess.DEVNULL,
+                                                stdout=subprocess.PIPE, stderr=stderr_file)
+            if source:
+                feeder = threading.Thread(target=self.feed, args=(source, errors), daemon=True)
+                feeder.start()
+
+            # blocks of key=value lines, each one ends with progress=continue (or progress=end)
+            values = {}
+            for line in self.process.stdout:
+                key, _, value = line.decode("utf-8", "replace").strip().partition("=")
+                values[key] = value
+                if key == "progress":
+                    self.report_progress(values, duration or 0)
+            returncode = self.process.wait()
+            if source:
+                feeder.join()
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+        if errors:
+            # the input broke off (download failed or cancelled), whatever ffmpeg made of it doesn't count
+            raise errors[0]
+        if self.cancelled:
+            raise ConversionCancelledError("Conversion of " + self.path + " was cancelled.")
+        if returncode:
+            raise FFmpegError(stderr.decode("utf-8", "replace").strip() or "ffmpeg exited with code " + str(returncode))
+        return output
+
+    def feed(self, source, errors):
+        try:
+            source(self.process.stdin)
+        except BrokenPipeError:
+            # ffmpeg is gone (error or cancelled), it's reported by convert_audio()
+            pass
+        except Exception as error:
+            errors.append(error)
+            self.process.kill()
+        finally:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+
+    def report_progress(self, values, duration):
+        try:
+            # out_time_ms is in microseconds as well (newer versions call it out_time_us)
+            done = int(values.get("out_time_us") or values.get("out_time_ms")) / 1000000
+        except (TypeError, ValueError):
+            done = 0.0
+        try:
+            speed = float(values.get("speed", "").rstrip("x"))
+        except ValueError:
+            speed = 0.0
+        if values.get("progress") == "end" and duration:
+            done = duration
+        eta = max(0.0, (duration - done) / speed) if duration and speed else -1.0
+        self.progress.emit(done, float(duration), speed, eta)
+
+    def get_duration(self):
+        if not self.ffprobe:
+            return None
+        returncode, stdout, stderr = self.run([self.ffprobe,
+                                               "-v", "error",
+                                               "-show_entries", "format=duration",
+                                               "-print_format", "csv=p=0",
+                                               self.path])
+        try:
+            return float(stdout.decode("utf-8").strip())
+        except ValueError:
+            return None
+
+    def mux(self, video_path, audio_path):
+        # lossless: both tracks are copied as they are into self.path's container, nothing's re-encoded
+        self.run_ffmpeg(["-i", video_path,
+                         "-i", audio_path,
+                         "-map", "0:v:0",
+                         "-map", "1:a:0",
+                         "-c", "copy",
+                         self.path])
+        return self.path
+
+    def extract(self):
+        self.get_audio_codec()
+        if not self.file_ext:
+            raise FFmpegError("Audio codec \"" + self.audio_codec + "\" isn't supported.")
+        output = os.path.splitext(self.path)[0] + self.file_ext
+        self.run_ffmpeg(["-i", self.path,
+                         "-vn",
+                         "-acodec", "copy",
+                         output])
+        return output
 
     def extract_audio(self):
         try:
-            self.get_audio_codec()
+            self.extract()
         except FFprobeNotFoundError as error:
             print(error, "\n", sys.exc_info())
             self.error.emit("Error", str(error), QtWidgets.QMessageBox.Warning, sys.exc_info(), True)
-        except FFprobeError as error:
+        except (FFprobeError, FFmpegError) as error:
             print(error, "\n", sys.exc_info())
             self.error.emit("Error", str(error), QtWidgets.QMessageBox.Critical, sys.exc_info(), True)
         else:
-            subprocess.run([self.ffmpeg,
-                            "-i", self.path,
-                            "-vn",
-                            "-acodec", "copy",
-                            self.path.split(".")[0] + self.file_ext])
+            self.success.emit()
 
     def get_audio_codec(self):
+        # known from the stream's metadata, probed before (maybe in a batch) or it's ffprobe's turn
+        self.audio_codec = self.audio_codec or probe_cache.get(self.path)
+        if not self.audio_codec:
+            self.probe_audio_codec()
+            probe_cache.put(self.path, self.audio_codec)
+        self.file_ext = self.codecs.get(self.audio_codec)
+
+    def probe_audio_codec(self):
         # TODO: testing (stdout decoding seems ewwww...)
         if self.ffprobe:
-            process = subprocess.Popen([self.ffprobe,
-                                        "-v", "error",
-                                        "-select_streams", "a:0",
-                                        "-show_entries", "stream=codec_name",
-                                        "-print_format", "csv=p=0",
-                                        self.path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = process.communicate()
+            returncode, stdout, stderr = self.run([self.ffprobe,
+                                                   "-v", "error",
+                                                   "-select_streams", "a:0",
+                                                   "-show_entries", "stream=codec_name",
+                                                   "-print_format", "csv=p=0",
+                                                   self.path])
             if stdout:
                 self.audio_codec = stdout.decode("utf-8").strip()  # does that work on Windows?! (stdout encoding different?)
-                self.file_ext = self.codecs.get(self.audio_codec)
             else:
                 raise FFprobeError(stderr)
         else:
             raise FFprobeNotFoundError("Couldn't find ffprobe. Make sure it's installed and in your PATH.")
+
+
+def codec_name(stream_codec):
+    if not stream_codec:
+        return None
+    codec = stream_codec.split(".")[0]
+    return FFmpeg.stream_codecs.get(codec, codec)
+
+
+class ProbeCache:
+    # a file that's still the same (path, size, mtime) still has the same codec
+    def __init__(self):
+        self.codecs = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+    def get(self, path):
+        with self.lock:
+            return self.codecs.get(self.key(path))
+
+    def put(self, path, codec):
+        key = self.key(path)
+        if key and codec:
+            with self.lock:
+                self.codecs[key] = codec
+
+
+probe_cache = ProbeCache()
+
+
+def probe_audio_codecs(paths, batch_size=32):
+    # ffprobe only takes one file, ffmpeg takes many: it lists the streams of every input before it complains
+    # about the missing output -> one process per batch instead of one per file
+    ffmpeg = shutil.which("ffmpeg")
+    paths = [path for path in paths if probe_cache.key(path) and not probe_cache.get(path)]
+    if not ffmpeg:
+        return
+    for start in range(0, len(paths), batch_size):
+        batch = paths[start:start + batch_size]
+        args = [ffmpeg, "-hide_banner", "-nostdin"]
+        for path in batch:
+            args += ["-i", path]
+        process = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        # inputs that couldn't be read (and everything after them) are left to ffprobe
+        for index, codec in re.findall(r"^\s*Stream #(\d+):\d+.*?: Audio: (\w+)",
+                                       process.stderr.decode("utf-8", "replace"), re.MULTILINE):
+            if not probe_cache.get(batch[int(index)]):
+                probe_cache.put(batch[int(index)], codec)
+
+
+ConversionResult = collections.namedtuple("ConversionResult", ["index", "path", "output", "error"])
+
+
+class ConversionBatch(QtCore.QObject):
+    # stream copies are cheap, re-encoding isn't: by default one ffmpeg per core, all on the "convert" pool
+    item_progress = QtCore.pyqtSignal(int, float, float, float, float)
+    item_finished = QtCore.pyqtSignal(object)
+    finished = QtCore.pyqtSignal(list)
+
+    def __init__(self, paths, max_workers=None, codec=None, bitrate=None, audio_codecs=None):
+        super().__init__()
+        self.paths = paths
+        # from the streams' metadata, if known
+        self.audio_codecs = audio_codecs or [None] * len(paths)
+        # no codec: the audio track is copied as it is
+        self.codec = codec
+        self.bitrate = bitrate
+        self.max_workers = max(1, max_workers or POOL_SIZES["convert"])
+        self.pool = get_pool("convert")
+
+        self.results = [None] * len(paths)
+        self.remaining = len(paths)
+        self.waiting = collections.deque(enumerate(paths))
+        self.converters = {}
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def start(self):
+        if not self.paths:
+            self.done.set()
+            self.finished.emit(self.results)
+            return self
+        unknown = [path for path, audio_codec in zip(self.paths, self.audio_codecs) if not audio_codec]
+        if not self.codec and len(unknown) > 1:
+            # spawning ffprobe for every file takes longer than copying the audio of short videos
+            self.pool.submit(probe_audio_codecs, unknown).add_done_callback(self.on_probed)
+        else:
+            self.schedule()
+        return self
+
+    def on_probed(self, future):
+        # a failed batch probe isn't fatal, every file is probed on its own then
+        if not future.cancelled():
+            self.schedule()
+
+    def schedule(self):
+        to_start = []
+        with self.lock:
+            while self.waiting and len(self.converters) < self.max_workers and not self.cancelled:
+                index, path = self.waiting.popleft()
+                converter = FFmpeg(path, self.audio_codecs[index])
+                converter.progress.connect(functools.partial(self.item_progress.emit, index),
+                                           QtCore.Qt.DirectConnection)
+                self.converters[index] = converter
+                to_start.append((index, converter))
+
+        for index, converter in to_start:
+            self.pool.submit(self.convert_item, index, converter).add_done_callback(self.on_item_done)
+
+    def convert_item(self, index, converter):
+        try:
+            output = converter.convert_audio(self.codec, self.bitrate) if self.codec else converter.extract()
+        except Exception:
+            return ConversionResult(index, converter.path, None, sys.exc_info())
+        return ConversionResult(index, converter.path, output, None)
+
+    def on_item_done(self, future):
+        if future.cancelled():
+            # pool is shutting down
+            return
+        result = future.result()
+        with self.lock:
+            del self.converters[result.index]
+        self.finish_item(result)
+        self.schedule()
+
+    def finish_item(self, result):
+        self.results[result.index] = result
+        self.item_finished.emit(result)
+
+        with self.lock:
+            self.remaining -= 1
+            finished = not self.remaining
+        if finished:
+            self.done.set()
+            self.finished.emit(self.results)
+
+    def cancel(self):
+        # waiting ones are finished right away, running ones as soon as their ffmpeg is gone
+        with self.lock:
+            self.cancelled = True
+            waiting = list(self.waiting)
+            self.waiting.clear()
+            running = list(self.converters.values())
+        for converter in running:
+            converter.cancel()
+        for index, path in waiting:
+            error = ConversionCancelledError("Conversion of " + path + " was cancelled.")
+            self.finish_item(ConversionResult(index, path, None, (type(error), error, None)))
+
+    def is_running(self):
+        return not self.done.is_set()
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.results
@@ -8,6 +8,8 @@ from updater import Update
 
 
 LICENSE = None
+# update threads of closed dialogs that were still busy, kept alive until they've finished
+running_updates = set()
 
 
 def show_msgbox(title, msg, icon=QtWidgets.QMessageBox.NoIcon, details=None, is_traceback=False):
@@ -213,13 +215,18 @@ class UpdateDialog(QtWidgets.QDialog):
             QtWidgets.QDialog.keyPressEvent(self, evt)
 
     def closeEvent(self, evt):
+        # the updater stops at its next check (at the latest after the chunk it's downloading), no terminate()
+        self.updater.cancel()
         self.thread.quit()
-        self.thread.wait(100)
-        if not self.thread.isFinished():
-            self.thread.terminate()
-            self.thread.wait(2000)
+        if not self.thread.wait(100):
+            # don't freeze the GUI until the current read returns, the thread finishes on its own
+            running_updates.add((self.thread, self.updater))
+            self.thread.finished.connect(self.update_finished)
         QtWidgets.QDialog.closeEvent(self, evt)
 
+    def update_finished(self):
+        running_updates.discard((self.thread, self.updater))
+
     def success(self):
         self.close()
         self.restart()
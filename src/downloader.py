@@ -0,0 +1,382 @@
+import collections
+import functools
+import os
+import sqlite3
+import sys
+import threading
+
+from PyQt5 import QtCore
+
+from bandwidth import get_scheduler
+from cache import get_cache
+from cancellation import CancelledError, CancelToken
+from converter import FFmpeg
+from retry import EXPIRED, RetryPolicy, classify
+from scheduling import LIST_ORDER, JobScheduler
+from streams import ADAPTIVE, AUDIO, StreamSelector, select_audio
+from transfer import download_stream, download_tracks, downloaded_bytes, pipe_stream
+from workers import get_pool
+
+
+DownloadResult = collections.namedtuple("DownloadResult", ["index", "title", "url", "stream", "path", "error", "job"])
+
+
+class DownloadEngine(QtCore.QObject):
+    max_concurrent = 3
+    max_resolving = 8
+    # don't resolve further ahead than this (signed stream urls expire after a few hours)
+    max_ready = 16
+    # bytes per second for every single job (on top of the global limit), 0: unlimited
+    job_rate = 0
+    # which resolved job of a playlist goes next (bumped ones and turns between playlists come first anyway)
+    policy = LIST_ORDER
+
+    started = QtCore.pyqtSignal(int)
+    item_started = QtCore.pyqtSignal(int, str)
+    item_finished = QtCore.pyqtSignal(object)
+    finished = QtCore.pyqtSignal(list)
+
+    def __init__(self, jobs, max_concurrent=None, queue=None, tracker=None, job_rate=None, policy=None, retry=None,
+                 codec=None, bitrate=None):
+        super().__init__()
+        self.jobs = list(jobs)
+        self.queue = queue
+        self.tracker = tracker
+        # audio only jobs are re-encoded to this codec while they download (None: downloaded as they are)
+        self.codec = codec
+        self.bitrate = bitrate
+        self.max_concurrent = max(1, max_concurrent or self.max_concurrent)
+        self.job_rate = self.job_rate if job_rate is None else job_rate
+        self.throttles = {}
+        # one token for all jobs, one child token per job
+        self.token = CancelToken()
+        self.tokens = {}
+        # stopped (instead of cancelled) jobs stay queued for the next run
+        self.requeue = False
+        self.retry = retry or RetryPolicy()
+        # index -> (timer, job) of jobs waiting for their next attempt
+        self.retrying = {}
+        self.pool = get_pool()
+
+        self.results = [None] * len(jobs)
+        self.remaining = len(jobs)
+        # sizes aren't known before resolving -> priorities and turns only
+        self.unresolved = JobScheduler()
+        self.ready = JobScheduler(policy or self.policy)
+        self.top_priority = max([job.priority for job in jobs] + [0])
+        for index, job in enumerate(self.jobs):
+            self.unresolved.push((index, job), job.priority, job.batch)
+        self.resolving = 0
+        self.downloading = 0
+        self.selectors = {}
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+
+    def download(self):
+        # doesn't block: metadata is resolved ahead of time (at most max_resolving at a time) and every job
+        # whose streams are known goes to one of max_concurrent download slots, all on the shared worker pool
+        self.started.emit(len(self.jobs))
+        if not self.jobs:
+            self.done.set()
+            self.finished.emit(self.results)
+            return
+        self.schedule()
+
+    def schedule(self):
+        to_resolve = []
+        to_download = []
+        with self.lock:
+            while (self.unresolved and self.resolving < self.max_resolving and
+                   self.resolving + len(self.ready) < self.max_ready):
+                to_resolve.append(self.unresolved.pop())
+                self.resolving += 1
+            while self.ready and self.downloading < self.max_concurrent:
+                to_download.append(self.ready.pop())
+                self.downloading += 1
+
+        for index, job in to_resolve:
+            get_pool("metadata").submit(self.resolve_item, index, job).add_done_callback(self.on_item_resolved)
+        for index, job, streams in to_download:
+            future = self.pool.submit(self.download_item, index, job, streams)
+            future.add_done_callback(functools.partial(self.on_item_done, index, job))
+
+    def resolve_item(self, index, job):
+        try:
+            return index, job, self.resolve(job.url), None
+        except Exception:
+            return index, job, None, sys.exc_info()
+
+    def on_item_resolved(self, future):
+        if future.cancelled():
+            # pool is shutting down, the job queue still knows about this one
+            return
+        index, job, streams, error = future.result()
+        if not error:
+            self.push_ready(index, streams)
+        with self.lock:
+            self.resolving -= 1
+        if error and not self.retry_later(index, job, None, error):
+            self.finish_item(self.failed(index, job, error))
+        self.schedule()
+
+    def push_ready(self, index, streams):
+        job = self.jobs[index]
+        sizes = self.sizes(job, streams) if self.ready.policy != LIST_ORDER else (None, None)
+        with self.lock:
+            # bumped meanwhile
+            job = self.jobs[index]
+            self.ready.push((index, job, streams), job.priority, job.batch, *sizes)
+
+    def on_item_done(self, index, job, future):
+        if future.cancelled():
+            return
+        with self.lock:
+            self.downloading -= 1
+        try:
+            result = future.result()
+        except Exception:
+            # whatever happens, this job has to finish or the engine never does
+            result = DownloadResult(index, job.title, job.url, None, None, sys.exc_info(), job)
+        if result is not None:
+            # None: it's going to be retried
+            self.finish_item(result)
+        self.schedule()
+
+    def retry_later(self, index, job, streams, error):
+        # transient errors try again with the same streams, expired urls are resolved again; the job waits outside
+        # of the download slots meanwhile
+        delay = self.retry.delay(index, error[1])
+        if delay is None or self.job_token(index).is_cancelled():
+            return False
+        kind = classify(error[1])
+        print("Retrying", job.title, "in", round(delay, 1), "seconds (" + kind + " error: " +
+              (str(error[1]) or type(error[1]).__name__) + ")", flush=True)
+        if kind == EXPIRED:
+            get_cache().forget(job.url)
+            streams = None
+        timer = threading.Timer(delay, self.retry_item, (index, streams))
+        timer.daemon = True
+        with self.lock:
+            self.retrying[index] = (timer, job)
+        timer.start()
+        return True
+
+    def retry_item(self, index, streams):
+        with self.lock:
+            if self.retrying.pop(index, None) is None:
+                # cancelled meanwhile
+                return
+            job = self.jobs[index]
+            if streams is None:
+                self.unresolved.push((index, job), job.priority, job.batch)
+        if streams is not None:
+            self.push_ready(index, streams)
+        self.schedule()
+
+    def finish_item(self, result):
+        self.results[result.index] = result
+        self.item_finished.emit(result)
+
+        with self.lock:
+            self.remaining -= 1
+            finished = not self.remaining
+        if finished:
+            self.done.set()
+            self.finished.emit(self.results)
+
+    def add(self, jobs):
+        # more jobs for a running engine (another playlist, say), they get their turns right away
+        with self.lock:
+            if not self.remaining or self.token.is_cancelled():
+                # too late, finished (or cancelled and just winding down) already -> they'd be cancelled right away
+                return False
+            for job in jobs:
+                self.unresolved.push((len(self.jobs), job), job.priority, job.batch)
+                self.top_priority = max(self.top_priority, job.priority)
+                self.jobs.append(job)
+                self.results.append(None)
+                self.remaining += 1
+        self.started.emit(len(self.jobs))
+        self.schedule()
+        return True
+
+    def bump(self, index, priority=None):
+        # ahead of everything that hasn't started yet (running ones just keep running), the last bumped goes first
+        with self.lock:
+            if priority is None:
+                self.top_priority += 1
+                priority = self.top_priority
+            job = self.jobs[index] = self.jobs[index]._replace(priority=priority)
+            found = self.unresolved.bump(lambda item: item[0] == index, priority)
+            found = self.ready.bump(lambda item: item[0] == index, priority) or found
+        self.update_queue("set_priority", job, priority)
+        return found
+
+    def set_policy(self, policy):
+        with self.lock:
+            self.ready.set_policy(policy)
+
+    def job_token(self, index):
+        with self.lock:
+            if index not in self.tokens:
+                self.tokens[index] = CancelToken(self.token)
+            return self.tokens[index]
+
+    def pause(self, index=None):
+        # running transfers flush what they have and close their connections, resuming continues with Range
+        (self.token if index is None else self.job_token(index)).pause()
+
+    def resume(self, index=None):
+        (self.token if index is None else self.job_token(index)).resume()
+
+    def is_paused(self):
+        return self.token.is_paused()
+
+    def cancel(self, index=None):
+        if index is not None:
+            self.job_token(index).cancel()
+            return
+        self.token.cancel()
+        # nothing that hasn't been resolved yet gets resolved anymore
+        with self.lock:
+            unresolved = self.unresolved.remove_all()
+            retrying = list(self.retrying.items())
+            self.retrying.clear()
+        for index, (timer, job) in retrying:
+            timer.cancel()
+            unresolved.append((index, job))
+        for index, job in unresolved:
+            self.finish_item(self.failed(index, job, (CancelledError, CancelledError("Cancelled."), None)))
+
+    def stop(self):
+        # like cancel, but the job queue keeps every unfinished job (their partial files resume next time)
+        self.requeue = True
+        self.cancel()
+
+    def set_job_rate(self, rate):
+        # running jobs too
+        self.job_rate = rate
+        for throttle in list(self.throttles.values()):
+            throttle.set_rate(rate)
+
+    def is_running(self):
+        return not self.done.is_set()
+
+    def download_item(self, index, job, streams):
+        self.item_started.emit(index, job.title)
+        token = self.job_token(index)
+        try:
+            self.update_queue("mark_running", job)
+            # cancelled or paused while waiting for a slot
+            token.wait()
+            stream = self.selector(job).select(streams)
+            if stream is None and job.mode == AUDIO:
+                raise LookupError("No audio stream available.")
+            if stream is None:
+                raise LookupError("No " + str(job.extension) + " stream in " + str(job.resolution) +
+                                  " (or lower) available.")
+            progress = self.tracker.add_job(job, stream.filesize or 0) if self.tracker else None
+            throttle = self.throttles[index] = get_scheduler().throttle(self.job_rate)
+            if job.mode == ADAPTIVE:
+                path = self.download_adaptive(stream, streams, job.destination, progress, throttle, token)
+            elif job.mode == AUDIO and self.codec:
+                path = self.download_converted(stream, self.codec, self.bitrate, job.destination, progress, throttle,
+                                               token)
+            else:
+                path = download_stream(stream, job.destination, progress, throttle, token)
+            result = DownloadResult(index, job.title, job.url, stream, path, None, job)
+            self.update_queue("mark_done", job, path)
+        except Exception:
+            error = sys.exc_info()
+            result = None if self.retry_later(index, job, streams, error) else self.failed(index, job, error)
+        finally:
+            self.throttles.pop(index, None)
+            if self.tracker:
+                self.tracker.finish_job(job)
+        return result
+
+    @staticmethod
+    def download_adaptive(video, streams, destination="", progress=None, throttle=None, token=None):
+        audio = select_audio(streams, video.subtype)
+        if audio is None:
+            raise LookupError("No audio stream available.")
+        path = os.path.join(destination or os.getcwd(), video.default_filename)
+        if os.path.isfile(path):
+            # muxed in an earlier run (the track files are gone by then)
+            return path
+
+        # both tracks at once, then copied into one file (the track files resume just like any other download)
+        base = os.path.splitext(path)[0]
+        video_path, audio_path = download_tracks(DownloadEngine.tracks(video, audio, path), progress, throttle, token)
+        if token:
+            token.wait()
+        # ffmpeg picks the container by extension -> temporary name keeps it
+        muxed = FFmpeg(base + ".muxing." + video.subtype).mux(video_path, audio_path)
+        os.replace(muxed, path)
+        os.remove(video_path)
+        os.remove(audio_path)
+        return path
+
+    @staticmethod
+    def download_converted(stream, codec, bitrate=None, destination="", progress=None, throttle=None, token=None):
+        # ffmpeg reads the audio while it's downloading, there's never a file to convert afterwards (nor one to resume
+        # from: a retry starts over)
+        path = os.path.join(destination or os.getcwd(), stream.default_filename)
+        source = functools.partial(pipe_stream, stream, progress=progress, throttle=throttle, token=token)
+        return FFmpeg(path, stream.audio_codec).convert_audio(codec, bitrate, source=source)
+
+    @staticmethod
+    def tracks(video, audio, path):
+        base = os.path.splitext(path)[0]
+        return [(video, base + ".f" + str(video.itag) + "." + video.subtype),
+                (audio, base + ".f" + str(audio.itag) + "." + audio.subtype)]
+
+    def sizes(self, job, streams):
+        # (whole size, what's still missing on disk) of what the job is going to download, None: unknown
+        stream = self.selector(job).select(streams)
+        if stream is None:
+            # fails right away, might as well do that first
+            return 0, 0
+        path = os.path.join(job.destination or os.getcwd(), stream.default_filename)
+        tracks = [(stream, path)]
+        if job.mode == ADAPTIVE:
+            audio = select_audio(streams, stream.subtype)
+            if audio is None or os.path.isfile(path):
+                # fails right away / muxed in an earlier run
+                return 0, 0
+            tracks = self.tracks(stream, audio, path)
+        if any(track.filesize is None for track, track_path in tracks):
+            return None, None
+        size = sum(track.filesize for track, track_path in tracks)
+        done = sum(downloaded_bytes(track_path, track.filesize, track.itag) for track, track_path in tracks)
+        return size, size - done
+
+    def update_queue(self, mark, job, *args):
+        # bookkeeping only: a locked queue mustn't stop the downloads (recover() sorts things out next start)
+        if not self.queue or job.id is None:
+            return
+        try:
+            getattr(self.queue, mark)(job.id, *args)
+        except sqlite3.Error as error:
+            print("Couldn't update the job queue (" + job.title + "):", error, flush=True)
+
+    def failed(self, index, job, error):
+        if issubclass(error[0], CancelledError) and self.requeue:
+            self.update_queue("mark_queued", job)
+        elif issubclass(error[0], CancelledError):
+            self.update_queue("mark_cancelled", job)
+        else:
+            self.update_queue("mark_failed", job, str(error[1]))
+        return DownloadResult(index, job.title, job.url, None, None, error, job)
+
+    @staticmethod
+    def resolve(url):
+        # the selectors pick progressive, adaptive or audio streams, depending on the job
+        return get_cache().streams(url, None)
+
+    def selector(self, job):
+        # every job of a playlist usually asks for the same thing -> build the preference list only once
+        key = (job.extension, job.resolution, job.mode)
+        if key not in self.selectors:
+            self.selectors[key] = StreamSelector(job.extension, job.resolution, mode=job.mode)
+        return self.selectors[key]
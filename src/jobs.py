@@ -0,0 +1,115 @@
+import collections
+import sqlite3
+import threading
+import time
+
+from streams import PROGRESSIVE
+
+
+Job = collections.namedtuple("Job", ["id", "title", "url", "extension", "resolution", "destination", "mode",
+                                   "priority", "batch"])
+
+
+def make_jobs(video_list, extension, resolution, destination="", mode=PROGRESSIVE, priority=0, batch=None):
+    return [Job(None, title, url, extension, resolution, destination, mode, priority, batch)
+            for title, url in video_list]
+
+
+class JobQueue:
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # one connection shared by the GUI and the download workers, serialized by self.lock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS jobs ("
+                                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                    "title TEXT, "
+                                    "url TEXT NOT NULL, "
+                                    "extension TEXT, "
+                                    "resolution TEXT, "
+                                    "destination TEXT, "
+                                    "status TEXT NOT NULL, "
+                                    "path TEXT, "
+                                    "error TEXT, "
+                                    "created REAL, "
+                                    "updated REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+            self.add_column("mode", "TEXT NOT NULL DEFAULT '" + PROGRESSIVE + "'")
+            self.add_column("priority", "INTEGER NOT NULL DEFAULT 0")
+            # jobs enqueued together (one playlist) share a batch, batches take turns
+            self.add_column("batch", "INTEGER")
+
+    def add_column(self, name, definition):
+        # queues created by older versions don't have every column yet
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(jobs)")]
+        if name not in columns:
+            self.connection.execute("ALTER TABLE jobs ADD COLUMN " + name + " " + definition)
+
+    def execute(self, sql, parameters=()):
+        with self.lock, self.connection:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def enqueue(self, jobs):
+        now = time.time()
+        queued = []
+        with self.lock, self.connection:
+            batch = self.connection.execute("SELECT COALESCE(MAX(batch), 0) + 1 FROM jobs").fetchone()[0]
+            for job in jobs:
+                job = job._replace(batch=batch if job.batch is None else job.batch)
+                cursor = self.connection.execute("INSERT INTO jobs (title, url, extension, resolution, destination, "
+                                                 "mode, priority, batch, status, created, updated) "
+                                                 "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                                 (job.title, job.url, job.extension, job.resolution,
+                                                  job.destination, job.mode, job.priority, job.batch, self.QUEUED,
+                                                  now, now))
+                queued.append(job._replace(id=cursor.lastrowid))
+        return queued
+
+    def recover(self):
+        # whatever was running when we crashed / got killed is queued again (partial files resume on their own)
+        self.execute("UPDATE jobs SET status = ?, updated = ? WHERE status = ?",
+                     (self.QUEUED, time.time(), self.RUNNING))
+        return self.pending()
+
+    def pending(self):
+        rows = self.execute("SELECT id, title, url, extension, resolution, destination, mode, priority, batch "
+                            "FROM jobs WHERE status = ? ORDER BY priority DESC, id", (self.QUEUED,))
+        return [Job(*row) for row in rows]
+
+    def mark_queued(self, job_id):
+        self.set_status(job_id, self.QUEUED)
+
+    def mark_running(self, job_id):
+        self.set_status(job_id, self.RUNNING)
+
+    def mark_done(self, job_id, path):
+        self.set_status(job_id, self.DONE, path=path)
+
+    def mark_failed(self, job_id, error):
+        self.set_status(job_id, self.FAILED, error=error)
+
+    def mark_cancelled(self, job_id):
+        self.set_status(job_id, self.CANCELLED)
+
+    def set_priority(self, job_id, priority):
+        self.execute("UPDATE jobs SET priority = ?, updated = ? WHERE id = ?", (priority, time.time(), job_id))
+
+    def set_status(self, job_id, status, path=None, error=None):
+        self.execute("UPDATE jobs SET status = ?, path = COALESCE(?, path), error = ?, updated = ? WHERE id = ?",
+                     (status, path, error, time.time(), job_id))
+
+    def counts(self):
+        return dict(self.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
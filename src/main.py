@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
-import collections.abc
 import os.path
 import sys
 import traceback
 
 from PyQt5 import QtCore, QtWidgets, QtGui
 
-from config import APP_PATH
-from converter import FFmpeg
-from dialogs import UpdateDialog, AboutDialog, show_msgbox, show_splash
+from bandwidth import get_scheduler, parse_schedule
+from config import APP_PATH, JOBS_FILE
+from converter import ConversionBatch
+from dialogs import UpdateDialog, AboutDialog, show_msgbox, show_splash, running_updates
+from downloader import DownloadEngine
+from jobs import JobQueue, make_jobs
+from network import use_for_pytube
+from progress import format_size, format_duration
+from scheduling import LIST_ORDER, SHORTEST_ETA_FIRST, SMALLEST_FIRST
+from streams import ADAPTIVE, AUDIO, PROGRESSIVE, FormatIndex, StreamSelector
+from tasks import Task
+from tracker import ProgressTracker
 from utils import LineEdit
+from workers import get_pool, shutdown as shutdown_workers
 from youtube import YouTube
 import resources
 
@@ -43,9 +52,22 @@ class DownloadWindow(QtWidgets.QMainWindow):
 
         self.videos = None
         self.playlist_videos = None
-        self.video_formats = None
+        self.format_index = FormatIndex()
+
+        self.job_queue = JobQueue(JOBS_FILE)
+        self.engine = None
+        self.pool = get_pool()
+        self.video_rows = {}
+        self.yt = None
+        self.dropdown_update_pending = False
+        self.conversions = set()
+
+        self.progress_tracker = ProgressTracker()
+        self.progress_tracker.job_progress.connect(self.on_job_progress)
+        self.progress_tracker.overall_progress.connect(self.on_overall_progress)
 
         self.init_ui()
+        QtCore.QTimer.singleShot(1200, self.resume_jobs)
 
     @QtCore.pyqtSlot(str, str, int, list)
     def show_msgbox(self, title, msg, icon, tb):
@@ -127,6 +149,11 @@ class DownloadWindow(QtWidgets.QMainWindow):
         url_box.spinning_wheel.setScaledSize(QtCore.QSize(26, 26))
         # url_box.loading_indicator.setMovie(url_box.spinning_wheel)
         url_box.videos_list_widget = QtWidgets.QListWidget()
+        url_box.videos_list_widget.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        url_box.videos_list_widget.setContextMenuPolicy(QtCore.Qt.ActionsContextMenu)
+        url_box.bump_action = QtWidgets.QAction("Download next", url_box.videos_list_widget)
+        url_box.bump_action.triggered.connect(self.on_bump_triggered)
+        url_box.videos_list_widget.addAction(url_box.bump_action)
         url_box.videos_list_widget.hide()
 
         # retain_size = QtWidgets.QSizePolicy(url_box.loading_indicator.sizePolicy())
@@ -155,13 +182,21 @@ class DownloadWindow(QtWidgets.QMainWindow):
 
         settings_box.continue_msg = QtWidgets.QLabel("Click \"Find videos...\" to continue.")
         settings_box.format_dropdown = QtWidgets.QComboBox()
-        settings_box.format_dropdown.activated[str].connect(self.on_format_changed)
+        settings_box.format_dropdown.activated[int].connect(self.on_format_changed)
         settings_box.format_dropdown.hide()
         settings_box.resolution_dropdown = QtWidgets.QComboBox()
         settings_box.resolution_dropdown.hide()
+        # progressive streams (video + audio in one file) stop at 720p, everything above is video only
+        settings_box.mode_dropdown = QtWidgets.QComboBox()
+        settings_box.mode_dropdown.addItem("Video (up to 720p)", PROGRESSIVE)
+        settings_box.mode_dropdown.addItem("Best quality video (separate video + audio, needs ffmpeg)", ADAPTIVE)
+        settings_box.mode_dropdown.addItem("Audio only (no video is downloaded at all)", AUDIO)
+        settings_box.mode_dropdown.activated[int].connect(self.on_mode_changed)
+        settings_box.mode_dropdown.hide()
 
         hbox1.addWidget(settings_box.continue_msg)
         vbox.addLayout(hbox1)
+        vbox.addWidget(settings_box.mode_dropdown)
         hbox2.addWidget(settings_box.format_dropdown)
         vbox.addLayout(hbox2)
         hbox3.addWidget(settings_box.resolution_dropdown)
@@ -171,11 +206,51 @@ class DownloadWindow(QtWidgets.QMainWindow):
 
         return settings_box
 
-    def on_format_changed(self, new_format):
-        self.settings_box.resolution_dropdown.clear()
-        format = YouTube.uglify(new_format)
-        for i in self.video_formats[format]:
-            self.settings_box.resolution_dropdown.addItem(YouTube.prettify(i))
+    def on_format_changed(self, index):
+        self.update_resolution_dropdown()
+
+    def on_mode_changed(self, index):
+        self.format_index.set_mode(self.settings_box.mode_dropdown.currentData())
+        self.update_format_dropdowns()
+
+    def update_format_dropdowns(self):
+        format_dropdown = self.settings_box.format_dropdown
+        current_format = format_dropdown.currentData()
+        format_dropdown.clear()
+        if self.format_index.resolved:
+            formats = self.format_index.formats()
+        else:
+            # nothing's resolved yet, so just offer what (almost) every video has
+            standard_formats = YouTube.audio_formats if self.format_index.mode == AUDIO else YouTube.standard_formats
+            formats = [(format, None) for format in standard_formats.keys()]
+        for format, count in formats:
+            format_dropdown.addItem(self.dropdown_text(format, count), format)
+        format_dropdown.setCurrentIndex(max(0, format_dropdown.findData(current_format)))
+
+        self.update_resolution_dropdown()
+
+    def update_resolution_dropdown(self):
+        resolution_dropdown = self.settings_box.resolution_dropdown
+        current_resolution = resolution_dropdown.currentData()
+        format = self.settings_box.format_dropdown.currentData()
+        resolution_dropdown.clear()
+        # audio only: the best bitrate is taken, nothing to choose
+        resolution_dropdown.setVisible(self.format_index.mode != AUDIO)
+        if self.format_index.mode == AUDIO:
+            return
+        if self.format_index.resolved:
+            resolutions = self.format_index.resolutions(format)
+        else:
+            resolutions = [(resolution, None) for resolution in YouTube.standard_formats.get(format, [])]
+        for resolution, count in resolutions:
+            resolution_dropdown.addItem(self.dropdown_text(resolution, count), resolution)
+        resolution_dropdown.setCurrentIndex(max(0, resolution_dropdown.findData(current_resolution)))
+
+    def dropdown_text(self, key, count):
+        text = (self.format_index.mode == AUDIO and YouTube.audio_formats.get(key)) or YouTube.prettify(key) or key
+        if count is not None and len(self.playlist_videos) > 1:
+            text += "  (" + str(count) + " of " + str(len(self.playlist_videos)) + " videos)"
+        return text
 
     def create_save_box(self):
         save_box = QtWidgets.QGroupBox("3. Choose download destination")
@@ -194,41 +269,197 @@ class DownloadWindow(QtWidgets.QMainWindow):
         save_box.download_btn = QtWidgets.QPushButton("DOWNLOAD")
         save_box.download_btn.clicked.connect(self.on_download_clicked)
         save_box.download_btn.hide()
+        save_box.pause_btn = QtWidgets.QPushButton("PAUSE")
+        save_box.pause_btn.clicked.connect(self.on_pause_clicked)
+        save_box.pause_btn.hide()
+        save_box.cancel_btn = QtWidgets.QPushButton("CANCEL")
+        save_box.cancel_btn.clicked.connect(self.on_cancel_clicked)
+        save_box.cancel_btn.hide()
+        save_box.progress_bar = QtWidgets.QProgressBar()
+        save_box.progress_bar.hide()
+        save_box.progress_lbl = QtWidgets.QLabel()
+        save_box.progress_lbl.hide()
+        # all of them apply right away, to running downloads as well
+        save_box.rate_spinbox = QtWidgets.QSpinBox()
+        save_box.rate_spinbox.setRange(0, 1000000)
+        save_box.rate_spinbox.setSuffix(" KB/s")
+        save_box.rate_spinbox.setSpecialValueText("unlimited")
+        save_box.rate_spinbox.valueChanged.connect(self.on_rate_changed)
+        save_box.job_rate_spinbox = QtWidgets.QSpinBox()
+        save_box.job_rate_spinbox.setRange(0, 1000000)
+        save_box.job_rate_spinbox.setSuffix(" KB/s")
+        save_box.job_rate_spinbox.setSpecialValueText("unlimited")
+        save_box.job_rate_spinbox.valueChanged.connect(self.on_job_rate_changed)
+        save_box.schedule_ledit = QtWidgets.QLineEdit()
+        save_box.schedule_ledit.setPlaceholderText("Limits by time of day, e.g. 08:00-18:00=500, 22:00-06:00=0")
+        save_box.schedule_ledit.editingFinished.connect(self.on_schedule_changed)
+        save_box.policy_dropdown = QtWidgets.QComboBox()
+        save_box.policy_dropdown.addItem("List order", LIST_ORDER)
+        save_box.policy_dropdown.addItem("Smallest first", SMALLEST_FIRST)
+        save_box.policy_dropdown.addItem("Shortest remaining time first", SHORTEST_ETA_FIRST)
+        save_box.policy_dropdown.currentIndexChanged.connect(self.on_policy_changed)
 
         hbox1.addWidget(save_box.continue_msg)
         vbox.addLayout(hbox1)
         hbox2.addWidget(save_box.destination_lbl)
         vbox.addLayout(hbox2)
         hbox3.addWidget(save_box.download_btn)
+        hbox3.addWidget(save_box.pause_btn)
+        hbox3.addWidget(save_box.cancel_btn)
         vbox.addLayout(hbox3)
+        vbox.addWidget(save_box.progress_bar)
+        vbox.addWidget(save_box.progress_lbl)
+        limits_layout = QtWidgets.QFormLayout()
+        limits_layout.addRow("Bandwidth limit:", save_box.rate_spinbox)
+        limits_layout.addRow("Per download:", save_box.job_rate_spinbox)
+        limits_layout.addRow("Schedule:", save_box.schedule_ledit)
+        limits_layout.addRow("Download order:", save_box.policy_dropdown)
+        vbox.addLayout(limits_layout)
 
         save_box.setLayout(vbox)
 
         return save_box
 
+    def on_rate_changed(self, rate):
+        get_scheduler().set_rate(rate * 1024)
+
+    def on_job_rate_changed(self, rate):
+        if self.engine:
+            self.engine.set_job_rate(rate * 1024)
+
+    def on_schedule_changed(self):
+        try:
+            get_scheduler().set_schedule(parse_schedule(self.save_box.schedule_ledit.text()))
+        except ValueError as error:
+            show_msgbox("Error", str(error), QtWidgets.QMessageBox.Warning)
+
+    def on_policy_changed(self, index):
+        if self.engine:
+            self.engine.set_policy(self.save_box.policy_dropdown.itemData(index))
+
+    def on_bump_triggered(self):
+        if not self.engine or not self.engine.is_running():
+            return
+        urls = {self.playlist_videos[self.url_box.videos_list_widget.row(item)][1]
+                for item in self.url_box.videos_list_widget.selectedItems()}
+        # bumped in reverse, so the first selected one goes first
+        for index in reversed(range(len(self.engine.jobs))):
+            if self.engine.jobs[index].url in urls and self.engine.results[index] is None:
+                if self.engine.bump(index):
+                    print("Downloading", self.engine.jobs[index].title, "next.", flush=True)
+
+    def on_pause_clicked(self):
+        if not self.engine or not self.engine.is_running():
+            return
+        if self.engine.is_paused():
+            self.engine.resume()
+            self.save_box.pause_btn.setText("PAUSE")
+        else:
+            # partial files stay, resuming continues where every connection stopped
+            self.engine.pause()
+            self.save_box.pause_btn.setText("RESUME")
+
+    def on_cancel_clicked(self):
+        if self.engine and self.engine.is_running():
+            print("Cancelling downloads...", flush=True)
+            self.engine.cancel()
+
     def on_download_clicked(self):
-        extension = YouTube.uglify(self.settings_box.format_dropdown.currentText())
-        resolution = YouTube.uglify(self.settings_box.resolution_dropdown.currentText())
+        extension = self.settings_box.format_dropdown.currentData()
+        resolution = self.settings_box.resolution_dropdown.currentData()
 
         if len(self.url_box.videos_list_widget) < 1:
             return
-        elif len(self.url_box.videos_list_widget) == 1:
-            if self.url_box.videos_list_widget.item(0).checkState() == QtCore.Qt.Checked:
-                YouTube._download_video(self.videos, extension, resolution)
-            else:
-                return
-        else:
-            checked_videos = []
-            for index, video in enumerate(self.playlist_videos):
-                if self.url_box.videos_list_widget.item(index).checkState() == QtCore.Qt.Checked:
+
+        mode = self.format_index.mode
+        if mode == AUDIO:
+            resolution = None
+        selector = StreamSelector(extension, resolution, mode=mode)
+        checked_videos = []
+        for index, video in enumerate(self.playlist_videos):
+            if self.url_box.videos_list_widget.item(index).checkState() == QtCore.Qt.Checked:
+                if self.format_index.offers(video[1], selector):
                     checked_videos.append(video)
-            if checked_videos:
-                YouTube._download_playlist(checked_videos, extension, resolution)
-            else:
-                return
+                else:
+                    print("Skipping", video[0], "(no audio stream available)" if mode == AUDIO else
+                          "(not available in " + extension + " " + str(resolution) + " or lower)", flush=True)
+        if not checked_videos:
+            return
+
+        self.download_jobs(self.job_queue.enqueue(make_jobs(checked_videos, extension, resolution, mode=mode)))
+
+    def resume_jobs(self):
+        jobs = self.job_queue.recover()
+        if jobs:
+            print("Resuming", len(jobs), "queued download(s) from the last session...", flush=True)
+            self.download_jobs(jobs)
+
+    def download_jobs(self, jobs):
+        if self.engine and self.engine.is_running() and self.engine.add(jobs):
+            # they take turns with the running ones
+            print("Queued", len(jobs), "download(s).", flush=True)
+            return
+
+        codec = None
+        if self.convert_box.auto_convert_checkbox.isChecked():
+            # audio only downloads that get re-encoded anyway go straight through ffmpeg
+            codec = self.convert_box.codec_dropdown.currentData()
+        self.engine = DownloadEngine(jobs, queue=self.job_queue, tracker=self.progress_tracker,
+                                     job_rate=self.save_box.job_rate_spinbox.value() * 1024,
+                                     policy=self.save_box.policy_dropdown.currentData(),
+                                     codec=codec, bitrate=self.convert_box.bitrate_dropdown.currentData())
+        self.engine.item_finished.connect(self.on_item_downloaded)
+        self.engine.finished.connect(YouTube.collect_results)
+        self.engine.finished.connect(self.on_downloads_finished)
+
+        self.save_box.progress_bar.setValue(0)
+        self.save_box.pause_btn.setText("PAUSE")
+        self.save_box.pause_btn.show()
+        self.save_box.cancel_btn.show()
+        self.save_box.progress_bar.show()
+        self.save_box.progress_lbl.show()
+        self.progress_tracker.start()
+        self.engine.download()
+
+    def on_item_downloaded(self, result):
+        print("Finished", result.index + 1, "of", len(self.engine.jobs),
+              "(" + result.title + ", " + result.stream.subtype + " " +
+              str(result.stream.resolution or result.stream.abr) + ")"
+              if not result.error else "with errors (" + result.title + ")", flush=True)
+        if result.error or not self.convert_box.auto_convert_checkbox.isChecked():
+            return
+        if result.job.mode == AUDIO and self.engine.codec:
+            print("Converted", result.title, "->", result.path)
+        else:
+            # converting this one overlaps with downloading the next ones
+            self.convert([result.path], [result.stream.audio_codec])
+
+    def on_job_progress(self, job, done, total, speed, eta):
+        row = self.video_rows.get(job.url)
+        if row is not None and total:
+            self.url_box.videos_list_widget.item(row).setText(str(row + 1) + " - " + job.title + " (" +
+                                                              str(done * 100 // total) + " %)")
+
+    def on_overall_progress(self, done, total, speed, eta):
+        if total:
+            self.save_box.progress_bar.setValue(done * 100 // total)
+        self.save_box.progress_lbl.setText(format_size(done) + " of " + format_size(total) + ", " +
+                                           format_size(speed) + "/s, " + format_duration(eta) + " remaining")
+
+    def on_downloads_finished(self):
+        if self.engine.is_running():
+            # a newer engine took over already
+            return
+        self.progress_tracker.stop()
+        self.save_box.pause_btn.hide()
+        self.save_box.cancel_btn.hide()
+        # pick up whatever was queued while we were busy
+        jobs = self.job_queue.pending()
+        if jobs:
+            self.download_jobs(jobs)
 
     def create_convert_box(self):
-        convert_box = QtWidgets.QGroupBox("4. (not really) Convert downloaded file")
+        convert_box = QtWidgets.QGroupBox("4. Convert downloaded file")
 
         vbox = QtWidgets.QVBoxLayout()
         hbox1 = QtWidgets.QHBoxLayout()
@@ -236,38 +467,82 @@ class DownloadWindow(QtWidgets.QMainWindow):
         hbox3 = QtWidgets.QHBoxLayout()
 
         convert_box.continue_msg = QtWidgets.QLabel("Click \"Find videos...\" to continue.")
-        convert_box.experimental_msg = QtWidgets.QLabel("EXPERIMENTAL: extract audio to file,"
+        convert_box.experimental_msg = QtWidgets.QLabel("EXPERIMENTAL: extract or convert audio to file,"
                                                         "\nconsole window recommended (for now)"
                                                         "\n(ffprobe + ffmpeg are required for this)")
         convert_box.experimental_msg.hide()
         convert_box.convert_btn = QtWidgets.QPushButton("CONVERT")
         convert_box.convert_btn.clicked.connect(self.on_convert_clicked)
         convert_box.convert_btn.hide()
+        convert_box.auto_convert_checkbox = QtWidgets.QCheckBox("Extract audio as soon as a video is downloaded")
+        convert_box.auto_convert_checkbox.hide()
+        convert_box.codec_dropdown = QtWidgets.QComboBox()
+        convert_box.codec_dropdown.addItem("Keep original audio (no re-encoding)", None)
+        for codec, text in (("mp3", "MP3 (.mp3)"), ("aac", "AAC (.aac)"), ("vorbis", "Vorbis (.ogg)"),
+                            ("opus", "Opus (.opus)")):
+            convert_box.codec_dropdown.addItem(text, codec)
+        convert_box.codec_dropdown.currentIndexChanged.connect(self.on_codec_changed)
+        convert_box.codec_dropdown.hide()
+        convert_box.bitrate_dropdown = QtWidgets.QComboBox()
+        for bitrate in ("128k", "192k", "256k", "320k"):
+            convert_box.bitrate_dropdown.addItem(bitrate.replace("k", " kbit/s"), bitrate)
+        convert_box.bitrate_dropdown.setCurrentIndex(1)
+        convert_box.bitrate_dropdown.hide()
+        convert_box.progress_lbl = QtWidgets.QLabel()
+        convert_box.progress_lbl.hide()
 
         hbox1.addWidget(convert_box.continue_msg)
         vbox.addLayout(hbox1)
         hbox2.addWidget(convert_box.experimental_msg)
         vbox.addLayout(hbox2)
+        hbox3.addWidget(convert_box.codec_dropdown)
+        hbox3.addWidget(convert_box.bitrate_dropdown)
         hbox3.addWidget(convert_box.convert_btn)
         vbox.addLayout(hbox3)
+        vbox.addWidget(convert_box.auto_convert_checkbox)
+        vbox.addWidget(convert_box.progress_lbl)
 
         convert_box.setLayout(vbox)
 
         return convert_box
 
-    @staticmethod
-    def on_convert_clicked():
+    def on_convert_clicked(self):
         if YouTube.last_downloaded:
             path_list = []
+            audio_codecs = []
             for stream in YouTube.last_downloaded:
                 path_list.append(os.path.abspath(stream.default_filename))
-            # TODO: put this in threads (GUI freezes) or use ffmpeg's async interface (but idk how that works...)
-            #       (+ error slots, progress indicator,...)
-            for index, path in enumerate(path_list):
-                print("Converting", index, "of", len(path_list), "...")
-                converter = FFmpeg(path)
-                converter.extract_audio()
-            print("Finished (more or less) successfully.")
+                audio_codecs.append(stream.audio_codec)
+            # TODO: progress indicator,...
+            print("Converting", len(path_list), "file(s)...")
+            self.convert(path_list, audio_codecs)
+
+    def on_codec_changed(self, index):
+        self.convert_box.bitrate_dropdown.setVisible(self.convert_box.codec_dropdown.currentData() is not None)
+
+    def convert(self, paths, audio_codecs=None):
+        codec = self.convert_box.codec_dropdown.currentData()
+        batch = ConversionBatch(paths, codec=codec, bitrate=self.convert_box.bitrate_dropdown.currentData(),
+                                audio_codecs=audio_codecs)
+        batch.item_progress.connect(lambda index, done, total, speed, eta:
+                                    self.on_conversion_progress(paths[index], done, total, speed, eta))
+        batch.item_finished.connect(self.on_item_converted)
+        batch.finished.connect(lambda results: self.conversions.discard(batch))
+        self.conversions.add(batch)
+        batch.start()
+
+    def on_conversion_progress(self, path, done, total, speed, eta):
+        self.convert_box.progress_lbl.setText(os.path.basename(path) + ": " +
+                                              (str(int(done * 100 // total)) + " %, " if total else "") +
+                                              str(round(speed, 1)) + "x, " + format_duration(eta) + " remaining")
+        self.convert_box.progress_lbl.show()
+
+    def on_item_converted(self, result):
+        if result.error:
+            print(result.error[1], "\n", result.error)
+            show_msgbox("Error", str(result.error[1]), QtWidgets.QMessageBox.Critical, result.error, True)
+        else:
+            print("Converted", result.path, "->", result.output)
 
     def get_videos_from_url(self, page_url=None):
         self.url_box.get_videos_btn.setDisabled(True)
@@ -278,19 +553,19 @@ class DownloadWindow(QtWidgets.QMainWindow):
         self.url_box.loading_indicator.setMovie(self.url_box.spinning_wheel)
         self.url_box.spinning_wheel.start()
 
+        if self.yt:
+            self.yt.cancel()
+            self.yt.video_resolved.disconnect()
         self.yt = YouTube(page_url)
-        self.thread = QtCore.QThread()
-        self.yt.moveToThread(self.thread)
-        self.yt.finished.connect(self.thread.quit)
+        self.yt.video_resolved.connect(self.on_video_resolved)
+        self.yt.finished.connect(self.on_search_finished)
         self.yt.video_found.connect(self.on_video_found)
+        self.yt.playlist_batch_found.connect(self.on_playlist_batch_found)
         self.yt.playlist_found.connect(self.on_playlist_found)
         self.yt.success.connect(self.on_success)
         self.yt.error.connect(show_msgbox)
 
-        self.thread.started.connect(self.yt.find_videos)
-        self.thread.finished.connect(self.on_thread_finished)
-
-        self.thread.start()
+        Task(self.pool, self.yt.find_videos).start()
 
     def on_video_found(self, video):
         # TODO: this doesn't have to be a QListWidget anymore since we can be sure to get only one video
@@ -301,40 +576,41 @@ class DownloadWindow(QtWidgets.QMainWindow):
         self.url_box.videos_list_widget.addItem(video_item)
         self.url_box.videos_list_widget.show()
 
-        self.video_formats = collections.OrderedDict()
-        for format in YouTube.formats.keys():
-            self.video_formats.update({format: []})
-        for streams in video:
-            self.video_formats[streams.subtype].append(streams.resolution)
-        for format, resolution in self.video_formats.items():
-            if not resolution:
-                self.video_formats.pop(format)
-
-        for i in self.video_formats.keys():
-            self.settings_box.format_dropdown.addItem(YouTube.prettify(i))
-        for i in list(self.video_formats.values())[0]:
-            self.settings_box.resolution_dropdown.addItem(YouTube.prettify(i))
-
         self.videos = video
+        # a single video is downloaded just like a playlist with one entry
+        self.playlist_videos = [(video[0].default_filename.split(".")[0], self.yt.page_url)]
+        self.video_rows = {self.yt.page_url: 0}
 
-    def on_playlist_found(self, videos):
-        for index, video_info in enumerate(videos):
+        self.format_index.add(self.yt.page_url, video)
+        self.update_format_dropdowns()
+
+    def on_playlist_batch_found(self, videos):
+        for index, video_info in enumerate(videos, len(self.playlist_videos)):
             video_item = QtWidgets.QListWidgetItem()
             video_item.setText(str(index + 1) + " - " + video_info[0])
             video_item.setFlags(video_item.flags() | QtCore.Qt.ItemIsUserCheckable)
             video_item.setCheckState(QtCore.Qt.Checked)
             self.url_box.videos_list_widget.addItem(video_item)
-            self.url_box.videos_list_widget.show()
+            self.video_rows[video_info[1]] = index
+        self.url_box.videos_list_widget.show()
+
+        self.playlist_videos.extend(videos)
+
+    def on_playlist_found(self, videos):
+        self.update_format_dropdowns()
 
-        self.video_formats = YouTube.standard_formats
-        for i in self.video_formats.keys():
-            self.settings_box.format_dropdown.addItem(YouTube.prettify(i))
-        for i in list(self.video_formats.values())[0]:
-            self.settings_box.resolution_dropdown.addItem(YouTube.prettify(i))
+    def on_video_resolved(self, url, streams):
+        self.format_index.add(url, streams)
+        # a few hundred of these can arrive per second, rebuild the dropdowns at most every 250 ms
+        if not self.dropdown_update_pending:
+            self.dropdown_update_pending = True
+            QtCore.QTimer.singleShot(250, self.on_dropdown_update_due)
 
-        self.playlist_videos = videos
+    def on_dropdown_update_due(self):
+        self.dropdown_update_pending = False
+        self.update_format_dropdowns()
 
-    def on_thread_finished(self):
+    def on_search_finished(self):
         self.url_box.spinning_wheel.stop()
         self.url_box.loading_indicator.clear()
         self.url_box.get_videos_btn.setEnabled(True)
@@ -346,18 +622,26 @@ class DownloadWindow(QtWidgets.QMainWindow):
 
     def on_success(self):
         self.url_box.videos_list_widget.clear()
+        self.playlist_videos = []
+        self.video_rows = {}
+        self.format_index = FormatIndex(YouTube.formats.keys(), YouTube.resolutions.keys(),
+                                        self.settings_box.mode_dropdown.currentData())
         self.settings_box.format_dropdown.clear()
         self.settings_box.resolution_dropdown.clear()
 
         self.settings_box.continue_msg.hide()
         self.settings_box.format_dropdown.show()
         self.settings_box.resolution_dropdown.show()
+        self.settings_box.mode_dropdown.show()
         self.save_box.continue_msg.hide()
         self.save_box.destination_lbl.show()
         self.save_box.download_btn.show()
         self.convert_box.continue_msg.hide()
         self.convert_box.experimental_msg.show()
         self.convert_box.convert_btn.show()
+        self.convert_box.auto_convert_checkbox.show()
+        self.convert_box.codec_dropdown.show()
+        self.on_codec_changed(self.convert_box.codec_dropdown.currentIndex())
 
 
 def startup():
@@ -365,9 +649,21 @@ def startup():
     logfile = os.path.join(APP_PATH, "yt-dl.log")
     if os.path.isfile(logfile):
         os.remove(logfile)
+    # pytube's requests (watch pages, video info, player js) share our keep-alive connections
+    use_for_pytube()
     app = QtWidgets.QApplication(sys.argv)
     window = DownloadWindow()
     app.exec()
+    if window.engine:
+        # running downloads stop after their current chunk, they're queued again for the next start
+        window.engine.stop()
+    for batch in list(window.conversions):
+        # don't leave ffmpeg processes behind
+        batch.cancel()
+    for thread, updater in list(running_updates):
+        # an update dialog closed while its thread was still reading, give it a moment to stop
+        thread.wait(2000)
+    shutdown_workers()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+import collections
+import http.client
+import ssl
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# youtube answers urllib's default user agent with 403 (pytube sends the same)
+USER_AGENT = "Mozilla/5.0"
+
+
+class Response:
+    # file-like, just like urllib's responses; the connection goes back to the pool once the body's read
+    def __init__(self, session, key, connection, response, url):
+        self.session = session
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        if response.length == 0:
+            # nothing to read (HEAD, 204, 304 or an empty body)
+            self.read()
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def info(self):
+        return self.headers
+
+    def read(self, amt=None):
+        data = self.response.read(amt)
+        if self.response.isclosed():
+            self.release()
+        return data
+
+    def release(self):
+        if self.connection:
+            reusable = self.response.isclosed() and not self.response.will_close
+            self.session.release(self.key, self.connection, reusable)
+            self.connection = None
+
+    def close(self):
+        # whatever's left unread makes the connection useless
+        self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Session:
+    # keep-alive connections per (scheme, host, port): no DNS + TCP + TLS handshake for every single request
+    max_per_host = 16
+    max_redirects = 5
+    timeout = 60
+
+    def __init__(self):
+        self.idle = collections.defaultdict(list)
+        self.slots = {}
+        self.lock = threading.Lock()
+        # loading the CA certificates once is enough
+        self.context = ssl.create_default_context()
+        self.proxies = urllib.request.getproxies()
+
+    def slot(self, key):
+        with self.lock:
+            if key not in self.slots:
+                self.slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return self.slots[key]
+
+    def connect(self, key):
+        with self.lock:
+            if self.idle[key]:
+                return self.idle[key].pop(), True
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.context), False
+        return http.client.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def release(self, key, connection, reusable):
+        if reusable:
+            with self.lock:
+                self.idle[key].append(connection)
+        else:
+            connection.close()
+        self.slot(key).release()
+
+    def request(self, method, url, headers=None):
+        for _ in range(self.max_redirects + 1):
+            response = self.send(method, url, headers)
+            location = response.getheader("Location")
+            if response.status not in (301, 302, 303, 307, 308) or not location:
+                break
+            response.close()
+            url = urllib.parse.urljoin(url, location)
+        else:
+            raise urllib.error.HTTPError(url, response.status, "Too many redirects", response.headers, None)
+
+        if response.status >= 400:
+            response.close()
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+        return response
+
+    def send(self, method, url, headers=None):
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in ("http", "https"):
+            raise urllib.error.URLError("Unsupported url scheme \"" + parsed.scheme + "\" (" + url + ")")
+        request_headers = {"User-Agent": USER_AGENT}
+        request_headers.update(headers or {})
+        if self.proxies.get(parsed.scheme) and not urllib.request.proxy_bypass(parsed.hostname):
+            # proxies are left to urllib (no pooling then)
+            return urllib.request.urlopen(urllib.request.Request(url, headers=request_headers, method=method))
+
+        key = (parsed.scheme, parsed.hostname, parsed.port)
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+        slot = self.slot(key)
+        slot.acquire()
+        try:
+            while True:
+                connection, reused = self.connect(key)
+                try:
+                    connection.request(method, path, headers=request_headers)
+                    return Response(self, key, connection, connection.getresponse(), url)
+                except (http.client.HTTPException, OSError) as error:
+                    connection.close()
+                    if not reused:
+                        raise urllib.error.URLError(error)
+                    # the server closed this one while it was idle, try again with the next (or a new) one
+        except BaseException:
+            slot.release()
+            raise
+
+    def get(self, url, headers=None):
+        return self.request("GET", url, headers)
+
+    def head(self, url, headers=None):
+        return self.request("HEAD", url, headers)
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
+
+
+def pytube_get(url=None, headers=False, streaming=False, chunk_size=8 * 1024):
+    # drop-in replacement for pytube.request.get (same arguments, same results), but through the shared session
+    if headers:
+        # pytube only wants the headers, no need to GET the whole video for that
+        with get_session().head(url) as response:
+            return {name.lower(): value for name, value in response.headers.items()}
+    response = get_session().get(url)
+    if streaming:
+        return stream_response(response, chunk_size)
+    with response:
+        return response.read().decode("utf-8")
+
+
+def stream_response(response, chunk_size=8 * 1024):
+    with response:
+        while True:
+            chunk = response.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def use_for_pytube():
+    import pytube.request
+    pytube.request.get = pytube_get
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = Session()
+        return _session
@@ -0,0 +1,184 @@
+import codecs
+import collections
+import html.parser
+import json
+import urllib.parse
+
+try:
+    import lxml.etree
+except ImportError:
+    lxml = None
+
+try:
+    import bs4
+except ImportError:
+    bs4 = None
+
+from network import get_session
+from workers import get_pool
+
+
+CHUNK_SIZE = 16 * 1024
+YOUTUBE_URL = "https://www.youtube.com"
+
+
+class PlaylistParser(html.parser.HTMLParser):
+    # streaming, pure Python (always available): only looks at tags, never builds a tree
+    link_class = "pl-video-title-link"
+    load_more_attr = "data-uix-load-more-href"
+
+    def __init__(self):
+        super().__init__()
+        self.videos = []
+        self.continuation = None
+        self.href = None
+        self.title = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self.load_more_attr in attrs:
+            # the "Load more" button, points to the next page of the playlist
+            self.continuation = attrs[self.load_more_attr]
+        if tag == "a" and self.link_class in (attrs.get("class") or "").split():
+            self.href = attrs.get("href")
+            self.title = []
+
+    def handle_data(self, data):
+        if self.href is not None:
+            self.title.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self.href is not None:
+            self.videos.append(("".join(self.title).strip(), YOUTUBE_URL + self.href))
+            self.href = None
+
+
+class LxmlPlaylistParser:
+    # streaming, libxml2 (fastest, if lxml is installed): elements are thrown away as soon as they're done
+    def __init__(self):
+        self.videos = []
+        self.continuation = None
+        # title links that have started but not ended yet
+        self.open_links = 0
+        self.parser = lxml.etree.HTMLPullParser(events=("start", "end"))
+
+    def feed(self, data):
+        self.parser.feed(data)
+        self.read_events()
+
+    def close(self):
+        self.parser.close()
+        self.read_events()
+
+    def read_events(self):
+        for event, element in self.parser.read_events():
+            is_link = element.tag == "a" and PlaylistParser.link_class in (element.get("class") or "").split()
+            if event == "start":
+                if PlaylistParser.load_more_attr in element.attrib:
+                    self.continuation = element.get(PlaylistParser.load_more_attr)
+                self.open_links += is_link
+                continue
+
+            if is_link:
+                self.open_links -= 1
+                self.videos.append(("".join(element.itertext()).strip(), YOUTUBE_URL + element.get("href")))
+            if self.open_links:
+                # part of a title that isn't complete yet (clear() would drop the text and the tail of nested tags)
+                continue
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+
+class SoupPlaylistParser:
+    # not streaming at all: builds the whole tree once everything's there (only kept as a fallback)
+    def __init__(self):
+        self.videos = []
+        self.continuation = None
+        self.chunks = []
+
+    def feed(self, data):
+        self.chunks.append(data)
+
+    def close(self):
+        page_soup = bs4.BeautifulSoup("".join(self.chunks), "html.parser")
+        for a in page_soup.find_all("a", class_=PlaylistParser.link_class):
+            self.videos.append((a.get_text().strip(), YOUTUBE_URL + a.get("href")))
+        load_more = page_soup.find(attrs={PlaylistParser.load_more_attr: True})
+        if load_more:
+            self.continuation = load_more.get(PlaylistParser.load_more_attr)
+
+
+PARSERS = collections.OrderedDict([("lxml", LxmlPlaylistParser if lxml else None),
+                                   ("html.parser", PlaylistParser),
+                                   ("bs4", SoupPlaylistParser if bs4 else None)])
+
+
+def get_parser(backend=None):
+    if backend:
+        if not PARSERS.get(backend):
+            raise ValueError("Playlist parser \"" + backend + "\" isn't available.")
+        return PARSERS[backend]
+    return next(parser for parser in PARSERS.values() if parser)
+
+
+def parse(page_html, backend=None):
+    parser = get_parser(backend)()
+    parser.feed(page_html)
+    parser.close()
+    return parser
+
+
+def video_key(url):
+    return urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get("v", [url])[0]
+
+
+def fetch_continuation(continuation):
+    with get_session().get(YOUTUBE_URL + "/" + continuation.lstrip("/")) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def iter_playlist(url, backend=None):
+    seen = set()
+
+    def new_videos(videos):
+        # the same video can show up more than once (in a playlist and across pages) -> only take it once
+        unseen = []
+        for video in videos:
+            key = video_key(video[1])
+            if key not in seen:
+                seen.add(key)
+                unseen.append(video)
+        return unseen
+
+    # parse while downloading and hand out whatever's new after every chunk -> first rows show up right away
+    parser = get_parser(backend)()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    found = 0
+    with get_session().get(url) as response:
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            parser.feed(decoder.decode(chunk, final=not chunk))
+            if not chunk:
+                parser.close()
+            if len(parser.videos) > found:
+                batch = new_videos(parser.videos[found:])
+                found = len(parser.videos)
+                if batch:
+                    yield batch
+            if not chunk:
+                break
+
+    # every page knows the token of the next one only -> at least fetch page n + 1 while page n is being parsed
+    pool = get_pool("pages")
+    future = pool.submit(fetch_continuation, parser.continuation) if parser.continuation else None
+    while future:
+        page = future.result()
+        if not page.get("content_html", "").strip():
+            break
+        continuation = parse(page.get("load_more_widget_html") or "", backend).continuation
+        future = pool.submit(fetch_continuation, continuation) if continuation else None
+
+        batch = new_videos(parse(page["content_html"], backend).videos)
+        if batch:
+            yield batch
@@ -0,0 +1,65 @@
+import time
+
+
+class Counter:
+    # written by exactly one thread (one connection), read by the tracker -> no lock needed
+    __slots__ = ("value",)
+
+    def __init__(self, value=0):
+        self.value = value
+
+    def add(self, size):
+        self.value += size
+
+
+class JobProgress:
+    smoothing = 0.3
+
+    def __init__(self, total):
+        self.total = total
+        self.counters = []
+        self.finished = False
+
+        self.last_time = time.monotonic()
+        self.last_done = 0
+        self.speed = 0.0
+
+    def counter(self, value=0):
+        counter = Counter(value)
+        self.counters.append(counter)
+        return counter
+
+    def done(self):
+        return sum(counter.value for counter in self.counters)
+
+    def sample(self, now):
+        done = self.done()
+        elapsed = now - self.last_time
+        if elapsed > 0:
+            speed = max(0, done - self.last_done) / elapsed
+            self.speed = speed if not self.speed else self.smoothing * speed + (1 - self.smoothing) * self.speed
+        self.last_time = now
+        self.last_done = done
+        return done
+
+    def eta(self, done):
+        if not self.speed:
+            return -1.0
+        return max(0, self.total - done) / self.speed
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return str(round(size, 1)) + " " + unit
+        size /= 1024
+
+
+def format_duration(seconds):
+    if seconds < 0:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return str(hours) + ":" + str(minutes).zfill(2) + ":" + str(seconds).zfill(2)
+    return str(minutes) + ":" + str(seconds).zfill(2)
@@ -0,0 +1,73 @@
+import collections
+import http.client
+import random
+import socket
+import threading
+import urllib.error
+
+from cancellation import CancelledError
+from transfer import IncompleteTransferError
+
+
+# transient: try again (same urls), expired: the signed stream urls aren't valid anymore -> resolve again,
+# permanent: no point in trying again (unavailable / private videos, no matching stream, disk full, ...)
+TRANSIENT = "transient"
+EXPIRED = "expired"
+PERMANENT = "permanent"
+
+
+def classify(error):
+    if isinstance(error, CancelledError):
+        return PERMANENT
+    if isinstance(error, urllib.error.HTTPError):
+        # googlevideo answers expired signatures with 403 (sometimes 410)
+        if error.code in (403, 410):
+            return EXPIRED
+        if error.code in (408, 429) or error.code >= 500:
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(error, (urllib.error.URLError, ConnectionError, socket.timeout, http.client.HTTPException,
+                          IncompleteTransferError)):
+        # dropped / refused / timed out connections, truncated responses
+        return TRANSIENT
+    # including the other transfer errors (no byte ranges, unknown size): they'd fail the same way again
+    return PERMANENT
+
+
+def retry_after(error):
+    # seconds the server asked us to wait (429 / 503), if any
+    if isinstance(error, urllib.error.HTTPError) and error.headers:
+        value = error.headers.get("Retry-After")
+        if value and value.strip().isdigit():
+            return int(value)
+    return None
+
+
+class RetryPolicy:
+    # per job
+    max_attempts = 5
+    # all jobs of a run together: a dead connection shouldn't turn into max_attempts * jobs retries
+    budget = 50
+    base_delay = 1.0
+    max_delay = 60.0
+
+    def __init__(self, max_attempts=None, budget=None):
+        self.max_attempts = self.max_attempts if max_attempts is None else max_attempts
+        self.remaining = self.budget if budget is None else budget
+        self.attempts = collections.Counter()
+        self.lock = threading.Lock()
+
+    def delay(self, key, error):
+        # seconds until the next attempt, None: give up
+        if classify(error) == PERMANENT:
+            return None
+        with self.lock:
+            if self.attempts[key] + 1 >= self.max_attempts or self.remaining <= 0:
+                return None
+            self.attempts[key] += 1
+            self.remaining -= 1
+            attempt = self.attempts[key]
+        # exponential with jitter (half of it random), so failed jobs don't all come back at the same moment
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        return max(delay, min(retry_after(error) or 0, self.max_delay))
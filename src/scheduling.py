@@ -0,0 +1,120 @@
+import collections
+import heapq
+import itertools
+
+
+# within a playlist: list order, smallest file first or least remaining bytes first (partial files count, at the
+# same speed for everyone that's the shortest ETA) -> the last two finish the most videos in the least time
+LIST_ORDER = "list order"
+SMALLEST_FIRST = "smallest first"
+SHORTEST_ETA_FIRST = "shortest eta first"
+
+
+class JobScheduler:
+    # bumped jobs (highest priority) always go first, otherwise the batches (playlists) enqueued take turns, so a
+    # small playlist doesn't wait behind hours of another one; within a batch the policy picks.
+    # one heap per batch, a pop only looks at the heads of the batches (there are only a few of them); bumping
+    # pushes the job again and leaves the old heap entry behind, it's skipped once it comes up
+    def __init__(self, policy=LIST_ORDER):
+        self.policy = policy
+        # order -> [priority, size, remaining, order, item, batch]
+        self.entries = {}
+        self.heaps = {}
+        self.counts = collections.Counter()
+        self.priorities = collections.Counter()
+        self.turns = collections.deque()
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def push(self, item, priority=0, batch=None, size=None, remaining=None):
+        order = next(self.counter)
+        entry = [priority or 0, size, size if remaining is None else remaining, order, item, batch]
+        self.entries[order] = entry
+        if not self.counts[batch]:
+            self.turns.append(batch)
+            self.heaps[batch] = []
+        self.counts[batch] += 1
+        self.priorities[entry[0]] += 1
+        heapq.heappush(self.heaps[batch], (self.key(entry), entry))
+
+    def key(self, entry):
+        # ends with the order, which is unique -> entries themselves are never compared
+        priority, size, remaining, order, item, batch = entry
+        if self.policy == LIST_ORDER:
+            return (-priority, False, 0, order)
+        cost = size if self.policy == SMALLEST_FIRST else remaining
+        # unknown sizes after the known ones
+        return (-priority, cost is None, cost or 0, order)
+
+    def is_current(self, heap_entry):
+        key, entry = heap_entry
+        return self.entries.get(entry[3]) is entry and -key[0] == entry[0]
+
+    def head(self, batch):
+        heap = self.heaps[batch]
+        while not self.is_current(heap[0]):
+            heapq.heappop(heap)
+        return heap[0][1]
+
+    def pop(self):
+        if not self.entries:
+            raise IndexError("pop from an empty scheduler")
+        top = max(self.priorities)
+        for batch in self.turns:
+            if self.head(batch)[0] == top:
+                break
+        key, entry = heapq.heappop(self.heaps[batch])
+        del self.entries[entry[3]]
+        self.discount(entry)
+        # this batch had its turn
+        self.turns.remove(batch)
+        if self.counts[batch]:
+            self.turns.append(batch)
+        else:
+            del self.counts[batch]
+            del self.heaps[batch]
+        return entry[4]
+
+    def discount(self, entry):
+        self.counts[entry[5]] -= 1
+        self.priorities[entry[0]] -= 1
+        if not self.priorities[entry[0]]:
+            del self.priorities[entry[0]]
+
+    def bump(self, match, priority):
+        # returns whether anything waiting matched
+        found = False
+        for entry in self.entries.values():
+            if not match(entry[4]):
+                continue
+            found = True
+            if entry[0] != priority:
+                self.discount(entry)
+                entry[0] = priority
+                self.counts[entry[5]] += 1
+                self.priorities[priority] += 1
+                heapq.heappush(self.heaps[entry[5]], (self.key(entry), entry))
+        return found
+
+    def remove_all(self):
+        items = [entry[4] for order, entry in sorted(self.entries.items())]
+        self.entries.clear()
+        self.heaps.clear()
+        self.counts.clear()
+        self.priorities.clear()
+        self.turns.clear()
+        return items
+
+    def set_policy(self, policy):
+        self.policy = policy
+        heaps = {batch: [] for batch in self.heaps}
+        for entry in self.entries.values():
+            heaps[entry[5]].append((self.key(entry), entry))
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        self.heaps = heaps
@@ -0,0 +1,179 @@
+import collections
+import re
+import urllib.parse
+
+import pytube.helpers
+
+
+# progressive: one stream with video + audio (up to 720p), adaptive: best video stream + best audio stream (muxed
+# afterwards), audio: just the best audio stream
+PROGRESSIVE = "progressive"
+ADAPTIVE = "adaptive"
+AUDIO = "audio"
+
+# audio only streams don't get the video's extension (they'd overwrite each other)
+audio_extensions = {"mp4": "m4a", "webm": "weba"}
+
+StreamInfo = collections.namedtuple("StreamInfo", ["itag", "mime_type", "subtype", "resolution", "fps", "abr",
+                                                   "is_progressive", "includes_audio_track",
+                                                   "includes_video_track", "audio_codec", "video_codec",
+                                                   "filesize", "url", "default_filename"])
+
+
+def url_parameter(url, name):
+    values = urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get(name)
+    return values[0] if values else None
+
+
+def stream_info(stream, title):
+    # pytube's Stream.filesize sends a HEAD request on every access -> only take what's in the (signed) url,
+    # unknown sizes are looked up once right before downloading
+    filesize = url_parameter(stream.url, "clen")
+    extension = stream.subtype
+    if stream.includes_audio_track and not stream.includes_video_track:
+        extension = audio_extensions.get(stream.subtype, stream.subtype)
+    return StreamInfo(int(stream.itag), stream.mime_type, stream.subtype, stream.resolution,
+                      getattr(stream, "fps", None), getattr(stream, "abr", None), stream.is_progressive,
+                      stream.includes_audio_track, stream.includes_video_track, stream.audio_codec,
+                      stream.video_codec, int(filesize) if filesize else None, stream.url,
+                      pytube.helpers.safe_filename(title) + "." + extension)
+
+
+def height(resolution):
+    match = re.match(r"(\d+)p", resolution or "")
+    return int(match.group(1)) if match else None
+
+
+def bitrate(abr):
+    match = re.match(r"(\d+)kbps", abr or "")
+    return int(match.group(1)) if match else 0
+
+
+def is_video_only(stream):
+    return stream.includes_video_track and not stream.includes_audio_track
+
+
+def is_audio_only(stream):
+    return stream.includes_audio_track and not stream.includes_video_track
+
+
+def has_mode(stream, mode):
+    if mode == ADAPTIVE:
+        return is_video_only(stream)
+    if mode == AUDIO:
+        return is_audio_only(stream)
+    return stream.is_progressive
+
+
+def select_audio(streams, subtype=None):
+    # best bitrate, preferably in the same container as the video (m4a for mp4, opus / vorbis for webm)
+    best = None
+    for stream in streams:
+        if is_audio_only(stream) and (best is None or (stream.subtype == subtype, bitrate(stream.abr)) >
+                                      (best.subtype == subtype, bitrate(best.abr))):
+            best = stream
+    return best
+
+
+def resolution_key(stream):
+    # 60 fps versions get their own entry ("1080p HFR"), the selector prefers them when that's picked
+    if stream.resolution and (stream.fps or 0) > 30:
+        return stream.resolution + " HFR"
+    return stream.resolution
+
+
+class StreamSelector:
+    heights = [4320, 2160, 1440, 1080, 720, 480, 360, 240, 144]
+
+    def __init__(self, extension, resolution, fallback=True, prefer_hfr=None, mode=PROGRESSIVE):
+        self.extension = extension
+        self.resolution = resolution
+        self.fallback = fallback
+        self.mode = mode
+        # "1080p HFR" and friends ask for 60 fps, everything else for the (smaller) 30 fps version
+        self.prefer_hfr = "HFR" in (resolution or "") if prefer_hfr is None else prefer_hfr
+
+        # the whole preference list is built once per request: the requested format from the requested resolution
+        # down to the smallest one (never anything bigger than requested)
+        target = height(resolution)
+        if target is None or not fallback:
+            preferences = [(extension, target)]
+        else:
+            preferences = [(extension, target)] + [(extension, other) for other in self.heights if other < target]
+        self.ranks = {preference: rank for rank, preference in enumerate(preferences)}
+
+    def rank(self, stream):
+        rank = self.ranks.get((stream.subtype, height(stream.resolution)))
+        if rank is None:
+            return None
+        is_hfr = (stream.fps or 0) > 30
+        return 2 * rank + (0 if is_hfr == self.prefer_hfr else 1)
+
+    def select(self, streams):
+        if self.mode == AUDIO:
+            # no resolutions, just the best bitrate (in the requested container, if there's one)
+            return select_audio(streams, self.extension)
+        # one pass, no sorting
+        best = best_rank = None
+        for stream in streams:
+            if not self.accepts(stream):
+                continue
+            rank = self.rank(stream)
+            if rank is not None and (best_rank is None or rank < best_rank):
+                best, best_rank = stream, rank
+        return best
+
+    def accepts(self, stream):
+        return has_mode(stream, self.mode)
+
+    def is_exact(self, stream):
+        if self.mode == AUDIO:
+            return stream.subtype == self.extension
+        return stream.subtype == self.extension and height(stream.resolution) == height(self.resolution)
+
+
+class FormatIndex:
+    def __init__(self, format_order=(), resolution_order=(), mode=PROGRESSIVE):
+        self.format_order = list(format_order)
+        self.resolution_order = list(resolution_order)
+        self.mode = mode
+        # format -> resolution -> videos offering that combination
+        self.index = {}
+        self.streams = {}
+
+    @property
+    def resolved(self):
+        return self.streams.keys()
+
+    def add(self, video, streams):
+        self.streams[video] = streams
+        for stream in streams:
+            if has_mode(stream, self.mode):
+                self.index.setdefault(stream.subtype, {}).setdefault(resolution_key(stream), set()).add(video)
+
+    def set_mode(self, mode):
+        if mode != self.mode:
+            self.mode = mode
+            self.index = {}
+            for video, streams in list(self.streams.items()):
+                self.add(video, streams)
+
+    def sort_key(self, order):
+        # known ones in the given order, unknown ones afterwards
+        return lambda key: (order.index(key) if key in order else len(order), str(key))
+
+    def formats(self):
+        return [(video_format, len(set().union(*self.index[video_format].values())))
+                for video_format in sorted(self.index, key=self.sort_key(self.format_order))]
+
+    def resolutions(self, video_format):
+        resolutions = self.index.get(video_format, {})
+        return [(resolution, len(resolutions[resolution]))
+                for resolution in sorted(resolutions, key=self.sort_key(self.resolution_order))]
+
+    def videos(self, video_format, resolution):
+        return self.index.get(video_format, {}).get(resolution, set())
+
+    def offers(self, video, selector):
+        # unresolved videos might still offer it
+        return video not in self.streams or selector.select(self.streams[video]) is not None
@@ -0,0 +1,34 @@
+from PyQt5 import QtCore
+
+
+class Task(QtCore.QObject):
+    # a function on one of the worker pools whose outcome arrives as Qt signals (workers itself stays Qt-free, the
+    # transfers use it too)
+    result = QtCore.pyqtSignal(object)
+    error = QtCore.pyqtSignal(tuple)
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, pool, fn, *args, **kwargs):
+        super().__init__()
+        self.pool = pool
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = None
+
+    def start(self):
+        # like QThread.start(): connect the signals first, then start
+        self.pool.tasks.add(self)
+        self.future = self.pool.submit(self.fn, *self.args, **self.kwargs)
+        self.future.add_done_callback(self.on_done)
+        return self
+
+    def on_done(self, future):
+        if not future.cancelled():
+            error = future.exception()
+            if error:
+                self.error.emit((type(error), error, error.__traceback__))
+            else:
+                self.result.emit(future.result())
+        self.finished.emit()
+        self.pool.tasks.discard(self)
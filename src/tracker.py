@@ -0,0 +1,62 @@
+import time
+
+from PyQt5 import QtCore
+
+from progress import JobProgress
+
+
+class ProgressTracker(QtCore.QObject):
+    max_rate = 4
+
+    # key, bytes done, bytes total, speed (bytes/s), eta (s, -1 = unknown); byte counts are objects because
+    # Qt's int is 32 bits wide and files >= 2 GB aren't that rare
+    job_progress = QtCore.pyqtSignal(object, object, object, float, float)
+    overall_progress = QtCore.pyqtSignal(object, object, float, float)
+
+    def __init__(self, max_rate=None):
+        super().__init__()
+        self.jobs = {}
+        self.reported = {}
+        self.reported_overall = None
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(int(1000 / (max_rate or self.max_rate)))
+        self.timer.timeout.connect(self.report)
+
+    def add_job(self, key, total):
+        if self.jobs and all(progress.finished for progress in self.jobs.values()):
+            # last batch is through, start counting the overall progress from scratch
+            self.jobs = {}
+            self.reported = {}
+        progress = JobProgress(total)
+        self.jobs[key] = progress
+        return progress
+
+    def finish_job(self, key):
+        if key in self.jobs:
+            self.jobs[key].finished = True
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.report()
+
+    def report(self):
+        now = time.monotonic()
+        overall_done = overall_total = 0
+        overall_speed = 0.0
+        for key, progress in list(self.jobs.items()):
+            done = progress.sample(now)
+            overall_done += done
+            overall_total += progress.total
+            if not progress.finished:
+                overall_speed += progress.speed
+            if self.reported.get(key) != done:
+                self.reported[key] = done
+                self.job_progress.emit(key, done, progress.total, progress.speed, progress.eta(done))
+
+        if self.jobs and self.reported_overall != (overall_done, overall_total):
+            self.reported_overall = (overall_done, overall_total)
+            eta = (overall_total - overall_done) / overall_speed if overall_speed else -1.0
+            self.overall_progress.emit(overall_done, overall_total, overall_speed, eta)
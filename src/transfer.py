@@ -0,0 +1,320 @@
+import concurrent.futures
+import json
+import os
+import threading
+
+from network import get_session
+from progress import JobProgress
+from workers import get_pool
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class TransferError(Exception):
+    pass
+
+
+class RangeNotSupportedError(TransferError):
+    pass
+
+
+class IncompleteTransferError(TransferError):
+    pass
+
+
+def open_url(url, start=None, end=None):
+    headers = {}
+    if start is not None:
+        headers["Range"] = "bytes=" + str(start) + "-" + ("" if end is None else str(end))
+    response = get_session().get(url, headers)
+    if start is not None and response.status != 206:
+        # server ignored the Range header and is about to send us the whole file
+        response.close()
+        raise RangeNotSupportedError("Server doesn't support byte ranges for " + url)
+    return response
+
+
+def copy_response(response, file_handle, on_chunk=None, throttle=None, token=None):
+    # False: stopped early because the token got paused / cancelled (the response isn't read to the end then)
+    while True:
+        if token and token.interrupted():
+            return False
+        chunk = response.read(CHUNK_SIZE)
+        if not chunk:
+            return True
+        file_handle.write(chunk)
+        if on_chunk:
+            on_chunk(len(chunk))
+        if throttle:
+            # blocks until we're allowed to read the next chunk
+            throttle(len(chunk))
+
+
+class Journal:
+    suffix = ".json"
+
+    def __init__(self, path, url, filesize, itag=None):
+        self.path = path
+        self.url = url
+        self.filesize = filesize
+        self.itag = itag
+        self.completed = []
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.path) as file_handle:
+                state = json.load(file_handle)
+        except (OSError, ValueError):
+            return False
+        # the signed url expires, so a journal belongs to a stream (itag + size), not to a url
+        if state.get("filesize") != self.filesize or state.get("itag") != self.itag:
+            return False
+        self.completed = [tuple(byte_range) for byte_range in state.get("completed", [])]
+        return True
+
+    def save(self):
+        state = {"url": self.url, "itag": self.itag, "filesize": self.filesize, "completed": self.completed}
+        with open(self.path + ".tmp", "w") as file_handle:
+            json.dump(state, file_handle)
+        os.replace(self.path + ".tmp", self.path)
+
+    def add(self, start, end):
+        with self.lock:
+            merged = []
+            for byte_range in sorted(self.completed + [(start, end)]):
+                if merged and byte_range[0] <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], byte_range[1]))
+                else:
+                    merged.append(byte_range)
+            self.completed = merged
+            self.save()
+
+    def missing(self):
+        gaps = []
+        position = 0
+        for start, end in self.completed:
+            if start > position:
+                gaps.append((position, start))
+            position = max(position, end)
+        if position < self.filesize:
+            gaps.append((position, self.filesize))
+        return gaps
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SegmentedDownload:
+    segments = 4
+    min_segment_size = 2 * 1024 * 1024
+    journal_interval = 1024 * 1024
+
+    def __init__(self, url, filesize, path, segments=None, itag=None, progress=None, throttle=None, token=None):
+        self.url = url
+        self.filesize = filesize
+        self.path = path
+        self.part_path = path + ".part"
+        self.segments = segments or self.segments
+        self.progress = progress or JobProgress(filesize)
+        self.throttle = throttle
+        self.token = token
+        self.counters = []
+        self.futures = []
+        self.journal = Journal(self.part_path + Journal.suffix, url, filesize, itag)
+
+    def split(self, gaps):
+        # keep halving the biggest gap until every connection has something to do (or gaps get too small)
+        ranges = list(gaps)
+        while ranges and len(ranges) < self.segments:
+            largest = max(ranges, key=lambda byte_range: byte_range[1] - byte_range[0])
+            if largest[1] - largest[0] < 2 * self.min_segment_size:
+                break
+            middle = (largest[0] + largest[1]) // 2
+            ranges.remove(largest)
+            ranges.extend([(largest[0], middle), (middle, largest[1])])
+        return sorted(ranges)
+
+    def run(self):
+        self.start()
+        return self.finish()
+
+    def start(self):
+        # only submits the segments, so several transfers can share the segment pool at the same time
+        self.futures = [get_pool("segments").submit(self.fetch_segment, start, end) for start, end in self.prepare()]
+
+    def prepare(self):
+        if not (os.path.isfile(self.part_path) and self.journal.load()):
+            # preallocate so every segment can write straight to its final offset (no concatenation afterwards)
+            with open(self.part_path, "wb") as file_handle:
+                file_handle.truncate(self.filesize)
+            self.journal.completed = []
+            self.journal.save()
+
+        # no ranges at all if the last run got killed between the last segment and commit(): finish() only commits
+        ranges = self.split(self.journal.missing())
+        # whatever's already on disk from an earlier run counts as done
+        self.progress.counter(self.filesize - sum(end - start for start, end in ranges))
+        return ranges
+
+    def finish(self):
+        # let every segment settle before looking at errors, nobody may write to the file afterwards
+        concurrent.futures.wait(self.futures)
+        try:
+            for future in self.futures:
+                future.result()
+        except RangeNotSupportedError:
+            self.fetch_whole()
+        return self.commit()
+
+    def commit(self):
+        os.replace(self.part_path, self.path)
+        self.journal.remove()
+        return self.path
+
+    def fetch_segment(self, start, end):
+        counter = self.progress.counter()
+        self.counters.append(counter)
+        position = start
+        while position < end:
+            if self.token:
+                # paused: no connection is kept open meanwhile, resuming asks for the rest with a new Range
+                self.token.wait()
+            position = self.fetch_range(position, end, counter)
+            if position < end and not (self.token and self.token.interrupted()):
+                raise IncompleteTransferError("Segment " + str(start) + "-" + str(end) + " of " + self.url +
+                                    " ended prematurely at byte " + str(position) + ".")
+
+    def fetch_range(self, start, end, counter):
+        with open_url(self.url, start, end - 1) as response, open(self.part_path, "r+b") as file_handle:
+            file_handle.seek(start)
+            journaled = start
+
+            def on_chunk(chunk_size):
+                nonlocal journaled
+                counter.add(chunk_size)
+                position = file_handle.tell()
+                if position - journaled >= self.journal_interval:
+                    file_handle.flush()
+                    self.journal.add(journaled, position)
+                    journaled = position
+
+            copy_response(response, file_handle, on_chunk, self.throttle, self.token)
+            # whatever made it to disk is journaled before pausing, so even a restart resumes from there
+            file_handle.flush()
+            self.journal.add(journaled, file_handle.tell())
+            return file_handle.tell()
+
+    def fetch_whole(self):
+        # no ranges, no resuming: start over from byte zero
+        self.journal.completed = []
+        for counter in self.counters:
+            counter.value = 0
+        counter = self.progress.counter()
+        with open_url(self.url) as response, open(self.part_path, "wb") as file_handle:
+            copy_stream(response, file_handle, counter.add, self.throttle, self.token)
+            check_complete(self.url, file_handle.tell(), self.filesize)
+        self.journal.add(0, self.filesize)
+
+
+def copy_stream(response, file_handle, on_chunk=None, throttle=None, token=None):
+    # no ranges to resume from -> pausing keeps the connection (and hopes the server keeps it too)
+    while not copy_response(response, file_handle, on_chunk, throttle, token):
+        token.wait()
+
+
+def check_complete(url, size, expected):
+    # http.client's read() just returns b"" when the connection drops early, whatever Content-Length said
+    if expected is not None and size != expected:
+        raise IncompleteTransferError(url + " ended prematurely at byte " + str(size) + " of " + str(expected) + ".")
+
+
+def content_length(url):
+    with get_session().head(url) as response:
+        length = response.getheader("Content-Length")
+    return int(length) if length else None
+
+
+def is_complete(path, filesize):
+    # finished (and committed) in an earlier run
+    return os.path.isfile(path) and os.path.getsize(path) == filesize and not os.path.isfile(path + ".part")
+
+
+def downloaded_bytes(path, filesize, itag=None):
+    # what earlier runs left on disk (and the next one resumes from)
+    if is_complete(path, filesize):
+        return filesize
+    journal = Journal(path + ".part" + Journal.suffix, None, filesize, itag)
+    if not (os.path.isfile(path + ".part") and journal.load()):
+        return 0
+    return sum(end - start for start, end in journal.completed)
+
+
+def download_stream(stream, destination="", progress=None, throttle=None, token=None):
+    path = os.path.join(destination or os.getcwd(), stream.default_filename)
+    filesize = stream.filesize or content_length(stream.url)
+    progress = progress or JobProgress(filesize or 0)
+    progress.total = filesize or 0
+
+    if not filesize:
+        # no size -> no ranges (and nothing to resume), one connection it is
+        with open_url(stream.url) as response, open(path + ".part", "wb") as file_handle:
+            copy_stream(response, file_handle, progress.counter().add, throttle, token)
+            length = response.getheader("Content-Length")
+            check_complete(stream.url, file_handle.tell(), int(length) if length else None)
+        os.replace(path + ".part", path)
+        return path
+    if is_complete(path, filesize):
+        progress.counter(filesize)
+        return path
+    return SegmentedDownload(stream.url, filesize, path, itag=stream.itag, progress=progress, throttle=throttle,
+                             token=token).run()
+
+
+def pipe_stream(stream, file_handle, progress=None, throttle=None, token=None):
+    # into a file object that's already open (e.g. ffmpeg's stdin) instead of a file: one connection, no resuming
+    progress = progress or JobProgress(stream.filesize or 0)
+    counter = progress.counter()
+    with open_url(stream.url) as response:
+        copy_stream(response, file_handle, counter.add, throttle, token)
+        length = response.getheader("Content-Length")
+        check_complete(stream.url, counter.value, int(length) if length else stream.filesize)
+
+
+def download_tracks(tracks, progress=None, throttle=None, token=None):
+    # several streams at once (e.g. video + audio of an adaptive video), their segments all share one pool
+    transfers = []
+    for stream, path in tracks:
+        filesize = stream.filesize or content_length(stream.url)
+        if not filesize:
+            raise TransferError("Size of " + stream.url + " is unknown, it can't be downloaded in parallel.")
+        transfers.append((stream, path, filesize))
+
+    progress = progress or JobProgress(0)
+    progress.total = sum(filesize for stream, path, filesize in transfers)
+    paths = [path for stream, path, filesize in transfers]
+    downloads = {}
+    for index, (stream, path, filesize) in enumerate(transfers):
+        if is_complete(path, filesize):
+            # the other track failed (or the app was stopped) after this one was done, don't fetch it again
+            progress.counter(filesize)
+            continue
+        downloads[index] = SegmentedDownload(stream.url, filesize, path, itag=stream.itag, progress=progress,
+                                             throttle=throttle, token=token)
+    for download in downloads.values():
+        download.start()
+
+    errors = []
+    for index, download in downloads.items():
+        # wait for every track, even if one has failed already (they write to disk until they're done)
+        try:
+            paths[index] = download.finish()
+        except Exception as error:
+            errors.append(error)
+    if errors:
+        raise errors[0]
+    return paths
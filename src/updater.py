@@ -1,15 +1,16 @@
 import os
 import shutil
 import sys
-import time
-import urllib.request
 import zipfile
 from datetime import datetime
 from distutils.version import StrictVersion
 
 from PyQt5 import QtCore, QtWidgets
 
+from cancellation import CancelledError, CancelToken
 from config import VERSION, IS_FROZEN, APP_PATH
+from network import get_session
+from transfer import copy_response
 
 
 # TODO: support updating if application is frozen (.exe)
@@ -24,13 +25,29 @@ class Update(QtCore.QObject):
     def __init__(self, url):
         super().__init__()
         self.url = url
+        self.token = CancelToken()
+        self.filename = None
+        self.dst_folder = None
+
+    def cancel(self):
+        # checked between the steps and while downloading, copying files is never interrupted halfway
+        self.token.cancel()
 
     def check_for_updates(self):
+        try:
+            self.update()
+        except CancelledError:
+            self.cleanup()
+        self.finished.emit()
+
+    def update(self):
         current_datetime = datetime.now().strftime("%Y%m%d_%H%M")
         self.filename = "yt-dl_update_" + current_datetime + ".zip"
 
         self.status_update.emit("1 / 5\nFetching the latest version from Github...")
-        urllib.request.urlretrieve(self.url, self.filename)
+        with get_session().get(self.url) as response, open(self.filename, "wb") as zip_file:
+            copy_response(response, zip_file, token=self.token)
+        self.token.wait()
 
         self.status_update.emit("2 / 5\nExtracting ZIP archive...")
         self.dst_folder = self.filename.split(".")[0]
@@ -38,6 +55,7 @@ class Update(QtCore.QObject):
 
         self.status_update.emit("3 / 5\nVerifying files...")
         self.new_files = self.query_files(self.dst_folder)
+        self.token.wait()
 
         if self.check_update_need():
             if not IS_FROZEN:
@@ -50,8 +68,9 @@ class Update(QtCore.QObject):
                 self.information.emit("Info", "Updated successfully! (" + self.old_version + " -> " + self.new_version
                                       + ")\nThe application will restart now for the update to take effect.",
                                       QtWidgets.QMessageBox.Information)
-                time.sleep(5)
-                self.success.emit()
+                # closing the dialog meanwhile skips the restart (the new files are used from the next start on)
+                if not self.token.cancelled.wait(5):
+                    self.success.emit()
             else:
                 self.status_update.emit("5 / 5\nCleaning up...")
                 self.cleanup()
@@ -65,8 +84,6 @@ class Update(QtCore.QObject):
             self.information.emit("Info", "There's no update available at the time!",
                                   QtWidgets.QMessageBox.Information)
 
-        self.finished.emit()
-
     @staticmethod
     def extract_zipball(fname, dst):
         with zipfile.ZipFile(fname) as archive:
@@ -104,5 +121,7 @@ class Update(QtCore.QObject):
                             QtWidgets.QMessageBox.Warning, sys.exc_info(), True)
 
     def cleanup(self):
-        shutil.rmtree(self.dst_folder)
-        os.remove(self.filename)
+        if self.dst_folder and os.path.isdir(self.dst_folder):
+            shutil.rmtree(self.dst_folder)
+        if self.filename and os.path.isfile(self.filename):
+            os.remove(self.filename)
@@ -0,0 +1,47 @@
+import concurrent.futures
+import os
+import threading
+
+
+class WorkerPool:
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # keeps running tasks.Task objects (and their signals) alive until they're done
+        self.tasks = set()
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=False):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# "workers" runs discovery and download jobs, "segments" only runs the range requests of a single transfer,
+# "pages" prefetches playlist pages, "metadata" resolves videos for downloads, "index" resolves whole playlists in
+# the background for the format dropdowns (on its own, so downloads never queue up behind it) and "convert" waits
+# for ffmpeg processes (one per core, so downloads never wait for conversions and vice versa); jobs block on their
+# segments and discovery on its pages, so they must never share threads (-> deadlock)
+POOL_SIZES = {"workers": max(8, 2 * (os.cpu_count() or 1)),
+              "segments": 16,
+              "pages": 2,
+              "metadata": 8,
+              "index": 4,
+              "convert": os.cpu_count() or 1}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name="workers"):
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = WorkerPool(name, POOL_SIZES.get(name, 4))
+        return _pools[name]
+
+
+def shutdown(wait=False):
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait)
+        _pools.clear()
@@ -1,14 +1,19 @@
 import collections.abc
-import html.parser
+import functools
 import sys
 import urllib.error
-import urllib.request
 
-import bs4
 import pytube
 import pytube.exceptions
+import pytube.extract
 from PyQt5 import QtCore, QtWidgets
 
+from cache import get_cache
+from cancellation import CancelledError
+from playlist import iter_playlist
+from streams import StreamSelector
+from workers import get_pool
+
 
 class YouTube(QtCore.QObject):
     resolutions = collections.OrderedDict([("144p", "144p"), ("144p 15 fps", "144p15"), ("240p", "240p"),
@@ -25,13 +30,18 @@ class YouTube(QtCore.QObject):
                                        ("3gpp", "MPEG-4 Visual (.3gpp)"),
                                        ("flv", "Sorenson H.263 (.flv)")])
 
+    audio_formats = collections.OrderedDict([("mp4", "AAC (.m4a)"),
+                                             ("webm", "Opus / Vorbis (.weba)")])
+
     standard_formats = collections.OrderedDict([("mp4", ["360p", "720p"]),
                                                 ("webm", ["360p"]),
                                                 ("3gpp", ["144p", "240p"])])
 
     finished = QtCore.pyqtSignal()
     video_found = QtCore.pyqtSignal(list)
+    playlist_batch_found = QtCore.pyqtSignal(list)
     playlist_found = QtCore.pyqtSignal(list)
+    video_resolved = QtCore.pyqtSignal(str, list)
     success = QtCore.pyqtSignal()
     error = QtCore.pyqtSignal(str, str, int, tuple, bool)
 
@@ -40,6 +50,7 @@ class YouTube(QtCore.QObject):
     def __init__(self, page_url):
         super().__init__()
         self.page_url = page_url
+        self.resolving = []
 
     def find_videos(self):
         try:
@@ -47,19 +58,17 @@ class YouTube(QtCore.QObject):
                 self.error.emit("Error", "No URL given. Enter a URL to continue.",
                                 QtWidgets.QMessageBox.Warning, (), True)
             else:
-                yt = pytube.YouTube(self.page_url)
-                yt.register_on_progress_callback(self.on_progress)
-                video = yt.streams.filter(progressive=True).desc().all()
+                video = get_cache().streams(self.page_url, None)
                 if video:
+                    self.page_url = pytube.extract.watch_url(pytube.extract.video_id(self.page_url))
                     self.success.emit()
                     # TODO: instead of passing the StreamQuery, pass "self" -> download_video can be an instance method
                     self.video_found.emit(video)
         except (ValueError, AttributeError, urllib.error.URLError):
             try:
-                yt = pytube.YouTube("https://" + self.page_url)
-                yt.register_on_progress_callback(self.on_progress)
-                video = yt.streams.filter(progressive=True).desc().all()
+                video = get_cache().streams("https://" + self.page_url, None)
                 if video:
+                    self.page_url = pytube.extract.watch_url(pytube.extract.video_id(self.page_url))
                     self.success.emit()
                     self.video_found.emit(video)
             except pytube.exceptions.RegexMatchError:
@@ -79,23 +88,36 @@ class YouTube(QtCore.QObject):
             self.finished.emit()
 
     def find_playlist(self, url):
-        page_html = urllib.request.urlopen(url).read()
-        page_soup = bs4.BeautifulSoup(page_html, "html.parser")
-
-        playlist_html = page_soup.find_all(
-            "a", attrs={"class": "pl-video-title-link yt-uix-tile-link yt-uix-sessionlink spf-link "})
-
-        if not playlist_html:
+        videos = []
+        for batch in iter_playlist(url):
+            if not videos:
+                self.success.emit()
+            videos.extend(batch)
+            self.playlist_batch_found.emit(batch)
+            self.resolve_videos(batch)
+
+        if not videos:
             self.error.emit("Error", "This is not a playlist (or shitty youtube have changed their html again).",
                             QtWidgets.QMessageBox.Warning, sys.exc_info(), True)
         else:
-            videos = []
-            for a in playlist_html:
-                videos.append((a.string.strip(), "https://www.youtube.com" + a.get("href")))
-
-            self.success.emit()
             self.playlist_found.emit(videos)
 
+    def resolve_videos(self, videos):
+        # fills the metadata cache in the background -> format index for the UI now, no resolving at download time
+        pool = get_pool("index")
+        for title, url in videos:
+            future = pool.submit(get_cache().streams, url, None)
+            future.add_done_callback(functools.partial(self.on_video_resolved, url))
+            self.resolving.append(future)
+
+    def on_video_resolved(self, url, future):
+        if not future.cancelled() and not future.exception():
+            self.video_resolved.emit(url, future.result())
+
+    def cancel(self):
+        for future in self.resolving:
+            future.cancel()
+
     @staticmethod
     def prettify(video_format):
         if video_format in YouTube.formats.keys():
@@ -124,66 +146,29 @@ class YouTube(QtCore.QObject):
                                   "available yet. Be patient!")
 
     @staticmethod
-    def _download_video(video, extension, resolution, destination=""):
-        # TODO: "really" do it (put downloading into thread, emit signals, update progress bar etc.)
-        global stream_filesize
-        YouTube.last_downloaded.clear()
-        successful_downloads = 0
-        errors = 0
-        print("Downloading ", "1", "of", "1", "...", flush=True)
-        try:
-            for stream in video:
-                if stream.subtype == extension and stream.resolution == resolution:
-                    stream_filesize = stream.filesize
-                    stream.download(destination)
-                    break
-        except Exception:
-            print("An error occurred:\n", sys.exc_info())
-            errors += 1
-        else:
-            successful_downloads += 1
-            YouTube.last_downloaded.append(stream)
-
-        print(successful_downloads, "of", "1", "videos were downloaded successfully.")
-        if errors:
-            print(errors, "errors occurred.")
-        return
-
-    @staticmethod
-    def _download_playlist(video_list, extension, resolution, destination=""):
-        # TODO: multi-threaded downloading -> playlists download faster
-        global stream_filesize
+    def collect_results(results):
         YouTube.last_downloaded.clear()
         successful_downloads = 0
         errors = 0
-        for index, video in enumerate(video_list):
-            print("Downloading", index + 1, "of", len(video_list), "...", flush=True)
-            try:
-                yt = pytube.YouTube(video[1])
-                # yt.register_on_progress_callback(self.on_progress)
-                video = yt.streams.filter(progressive=True).desc().all()
-                for stream in video:
-                    if stream.subtype == extension and stream.resolution == resolution:
-                        stream_filesize = stream.filesize
-                        stream.download(destination)
-
-            except Exception:
-                print("An error occurred:\n", sys.exc_info())
+        cancelled = 0
+        for result in results:
+            if result.error and issubclass(result.error[0], CancelledError):
+                cancelled += 1
+            elif result.error:
+                print("An error occurred (" + result.title + "):\n", result.error)
                 errors += 1
             else:
                 successful_downloads += 1
-                YouTube.last_downloaded.append(stream)
-
-        print(successful_downloads, "of", len(video_list), "videos were downloaded successfully.")
+                YouTube.last_downloaded.append(result.stream)
+                if not StreamSelector(result.job.extension, result.job.resolution,
+                                      mode=result.job.mode).is_exact(result.stream):
+                    print(result.title, "isn't available in", result.job.extension,
+                          str(result.job.resolution or result.job.mode) + ",", "downloaded", result.stream.subtype,
+                          result.stream.resolution or result.stream.abr, "instead.")
+
+        print(successful_downloads, "of", len(results), "videos were downloaded successfully.")
         if errors:
             print(errors, "errors occurred.")
-        return
-
-    def on_progress(self, stream, chunk, file_handle, bytes_remaining):
-        # accessing stream.filesize was a bottleneck -> fixed by declaring global var in download_video
-        #
-        # printing this data luckily doesn't affect performance negatively, now let's see how fast Qt is...
-
-        # print(stream_filesize - bytes_remaining, "of", stream_filesize, "bytes downloaded,",
-        #       bytes_remaining, "bytes remaining")
-        pass
+        if cancelled:
+            print(cancelled, "downloads were cancelled.")
+        return results
@@ -0,0 +1,49 @@
+import datetime
+import time
+
+import pytest
+
+from bandwidth import BandwidthScheduler, TokenBucket, parse_schedule
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket()
+    start = time.monotonic()
+    for _ in range(1000):
+        bucket.consume(1024 * 1024)
+    assert time.monotonic() - start < 0.5
+
+
+def test_bucket_keeps_the_rate():
+    bucket = TokenBucket(1000000)
+    start = time.monotonic()
+    for _ in range(10):
+        bucket.consume(50000)
+    # 500 KB at 1 MB/s, the first chunk goes right away
+    assert 0.4 <= time.monotonic() - start < 1.0
+
+
+def test_lifting_the_limit_wakes_waiting_consumers():
+    bucket = TokenBucket(1000)
+    bucket.consume(100000)
+    bucket.set_rate(0)
+    start = time.monotonic()
+    bucket.consume(100000)
+    assert time.monotonic() - start < 0.5
+
+
+def test_parse_schedule():
+    assert parse_schedule("08:00-18:00=500, 22:00-06:00=0") == [
+        (datetime.time(8, 0), datetime.time(18, 0), 500 * 1024),
+        (datetime.time(22, 0), datetime.time(6, 0), 0)]
+    assert parse_schedule("") == []
+    with pytest.raises(ValueError):
+        parse_schedule("8-18=500")
+
+
+def test_schedule_windows_wrap_around_midnight():
+    scheduler = BandwidthScheduler(100, parse_schedule("08:00-18:00=5, 22:00-06:00=7"))
+    assert scheduler.current_rate(datetime.time(12, 0)) == 5 * 1024
+    assert scheduler.current_rate(datetime.time(23, 30)) == 7 * 1024
+    assert scheduler.current_rate(datetime.time(3, 0)) == 7 * 1024
+    assert scheduler.current_rate(datetime.time(20, 0)) == 100
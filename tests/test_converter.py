@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from cancellation import CancelledError  # noqa: E402
+from converter import FFmpeg  # noqa: E402
+
+pytestmark = pytest.mark.skipif(os.name == "nt", reason="the stand-in ffmpeg is a script with a shebang")
+
+# copies its input to the output, a lot of noise on stderr (more than a pipe holds) included
+FAKE_FFMPEG = """#!{python}
+import sys
+
+args = sys.argv
+source = args[args.index("-i") + 1]
+data = sys.stdin.buffer.read() if source == "pipe:0" else open(source, "rb").read()
+sys.stderr.write("x" * 1000000)
+print("out_time_us=1000000\\nspeed=2x\\nprogress=end", flush=True)
+with open(args[-1], "wb") as file_handle:
+    file_handle.write(data)
+"""
+
+
+@pytest.fixture
+def converter(tmp_path):
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text(FAKE_FFMPEG.replace("{python}", sys.executable))
+    ffmpeg.chmod(0o755)
+    converter = FFmpeg(str(tmp_path / "song.m4a"))
+    converter.ffmpeg = str(ffmpeg)
+    return converter
+
+
+def test_convert_audio_reads_from_a_pipe(converter, tmp_path):
+    output = converter.convert_audio("mp3", "192k", source=lambda stdin: stdin.write(b"a" * 1000000))
+    assert output == str(tmp_path / "song.mp3")
+    with open(output, "rb") as file_handle:
+        assert file_handle.read() == b"a" * 1000000
+
+
+def test_a_broken_source_fails_the_conversion(converter):
+    def source(stdin):
+        stdin.write(b"a" * 1000)
+        raise CancelledError("Cancelled.")
+
+    with pytest.raises(CancelledError):
+        converter.convert_audio("mp3", source=source)
@@ -0,0 +1,50 @@
+import pytest
+
+pytest.importorskip("pytube")
+
+from jobs import JobQueue, make_jobs  # noqa: E402
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    yield queue
+    queue.close()
+
+
+def test_enqueue_assigns_ids_and_one_batch_per_call(queue):
+    first = queue.enqueue(make_jobs([("a", "url-a"), ("b", "url-b")], "mp4", "720p"))
+    second = queue.enqueue(make_jobs([("c", "url-c")], "webm", "1080p"))
+    assert all(job.id is not None for job in first + second)
+    assert first[0].batch == first[1].batch != second[0].batch
+
+
+def test_pending_orders_by_priority_then_id(queue):
+    jobs = queue.enqueue(make_jobs([("a", "url-a"), ("b", "url-b"), ("c", "url-c")], "mp4", "720p"))
+    queue.set_priority(jobs[2].id, 5)
+    queue.mark_done(jobs[0].id, "a.mp4")
+    assert [job.title for job in queue.pending()] == ["c", "b"]
+
+
+def test_recover_requeues_running_jobs_only(queue):
+    jobs = queue.enqueue(make_jobs([(title, "url-" + title) for title in "abcde"], "mp4", "720p"))
+    queue.mark_running(jobs[0].id)
+    queue.mark_done(jobs[1].id, "b.mp4")
+    queue.mark_failed(jobs[2].id, "boom")
+    queue.mark_cancelled(jobs[3].id)
+    assert [job.title for job in queue.recover()] == ["a", "e"]
+    assert queue.counts() == {"queued": 2, "done": 1, "failed": 1, "cancelled": 1}
+
+
+def test_jobs_survive_reopening(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    queue = JobQueue(path)
+    queue.enqueue(make_jobs([("a", "url-a")], "mp4", "720p", mode="audio"))
+    queue.close()
+
+    reopened = JobQueue(path)
+    try:
+        [job] = reopened.pending()
+        assert (job.title, job.url, job.extension, job.mode) == ("a", "url-a", "mp4", "audio")
+    finally:
+        reopened.close()
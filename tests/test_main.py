@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+pytest.importorskip("PyQt5")
+pytest.importorskip("pytube")
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5 import QtWidgets  # noqa: E402
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def window(tmp_path, monkeypatch):
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    monkeypatch.setattr(main, "JOBS_FILE", str(tmp_path / "jobs.sqlite"))
+    window = main.DownloadWindow()
+    yield window
+    window.job_queue.close()
+    window.close()
+    app.processEvents()
+
+
+def test_convert_keeps_the_batch_until_it_finishes(window, monkeypatch):
+    started = []
+    # no ffmpeg here, the batch only has to be tracked (the exit path cancels whatever's in window.conversions)
+    monkeypatch.setattr(main.ConversionBatch, "start", lambda batch: started.append(batch))
+    window.convert(["video.mp4"])
+    assert window.conversions == set(started) and len(started) == 1
+
+    started[0].finished.emit([])
+    assert not window.conversions
@@ -0,0 +1,30 @@
+import pytest
+
+from playlist import PARSERS, parse
+
+PAGE = ("<html><body><table><tr><td>"
+        "<a class=\"pl-video-title-link yt-uix-tile-link\" href=\"/watch?v=first&amp;list=PL\">\n"
+        "  Hello <b>World</b> tail\n</a>"
+        "<div class=\"pl-video-owner\">by <a href=\"/channel/UC\">Uploader</a></div>"
+        "</td></tr><tr><td>"
+        "<a class=\"pl-video-title-link\" href=\"/watch?v=second\"><span>Second</span></a>"
+        "</td></tr></table>"
+        "<button data-uix-load-more-href=\"/browse_ajax?continuation=token\">Load more</button>"
+        "</body></html>")
+
+
+@pytest.mark.parametrize("backend", [name for name, parser in PARSERS.items() if parser])
+def test_backends_agree(backend):
+    parser = parse(PAGE, backend)
+    assert parser.videos == [("Hello World tail", "https://www.youtube.com/watch?v=first&list=PL"),
+                             ("Second", "https://www.youtube.com/watch?v=second")]
+    assert parser.continuation == "/browse_ajax?continuation=token"
+
+
+@pytest.mark.parametrize("backend", [name for name, parser in PARSERS.items() if parser])
+def test_chunks_split_anywhere(backend):
+    parser = PARSERS[backend]()
+    for index in range(0, len(PAGE), 7):
+        parser.feed(PAGE[index:index + 7])
+    parser.close()
+    assert [title for title, url in parser.videos] == ["Hello World tail", "Second"]
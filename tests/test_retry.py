@@ -0,0 +1,58 @@
+import email.message
+import urllib.error
+
+import pytest
+
+from cancellation import CancelledError
+from retry import EXPIRED, PERMANENT, TRANSIENT, RetryPolicy, classify
+from transfer import IncompleteTransferError, RangeNotSupportedError, TransferError
+
+
+def http_error(code, headers=None):
+    return urllib.error.HTTPError("https://example.com", code, "", headers, None)
+
+
+@pytest.mark.parametrize("error, kind", [
+    (http_error(403), EXPIRED),
+    (http_error(410), EXPIRED),
+    (http_error(429), TRANSIENT),
+    (http_error(503), TRANSIENT),
+    (http_error(404), PERMANENT),
+    (urllib.error.URLError(ConnectionResetError()), TRANSIENT),
+    (ConnectionResetError(), TRANSIENT),
+    (TimeoutError(), TRANSIENT),
+    (IncompleteTransferError("ended prematurely"), TRANSIENT),
+    (TransferError("size unknown"), PERMANENT),
+    (RangeNotSupportedError("no ranges"), PERMANENT),
+    (LookupError("no stream"), PERMANENT),
+    (CancelledError("cancelled"), PERMANENT),
+    (OSError(28, "No space left on device"), PERMANENT),
+])
+def test_classify(error, kind):
+    assert classify(error) == kind
+
+
+def test_permanent_errors_are_never_retried():
+    assert RetryPolicy().delay("job", http_error(404)) is None
+
+
+def test_backoff_grows_and_gives_up_after_max_attempts():
+    policy = RetryPolicy(max_attempts=4, budget=100)
+    delays = [policy.delay("job", ConnectionResetError()) for _ in range(3)]
+    assert 0.5 <= delays[0] <= 1 and 1 <= delays[1] <= 2 and 2 <= delays[2] <= 4
+    assert policy.delay("job", ConnectionResetError()) is None
+    # other jobs have attempts of their own
+    assert policy.delay("other", ConnectionResetError()) is not None
+
+
+def test_budget_is_shared_by_all_jobs():
+    policy = RetryPolicy(max_attempts=10, budget=2)
+    assert policy.delay("a", ConnectionResetError()) is not None
+    assert policy.delay("b", ConnectionResetError()) is not None
+    assert policy.delay("c", ConnectionResetError()) is None
+
+
+def test_retry_after_is_honoured():
+    headers = email.message.Message()
+    headers["Retry-After"] = "7"
+    assert RetryPolicy().delay("job", http_error(429, headers)) >= 7
@@ -0,0 +1,95 @@
+import time
+
+from scheduling import LIST_ORDER, SHORTEST_ETA_FIRST, SMALLEST_FIRST, JobScheduler
+
+
+def pop_all(scheduler):
+    return [scheduler.pop() for _ in range(len(scheduler))]
+
+
+def test_list_order_within_a_batch():
+    scheduler = JobScheduler(LIST_ORDER)
+    for item in "abc":
+        scheduler.push(item, batch=1)
+    assert pop_all(scheduler) == ["a", "b", "c"]
+    assert not scheduler
+
+
+def test_batches_take_turns():
+    scheduler = JobScheduler()
+    for index in range(4):
+        scheduler.push("a" + str(index), batch=1)
+    scheduler.push("b0", batch=2)
+    scheduler.push("c0", batch=3)
+    assert pop_all(scheduler) == ["a0", "b0", "c0", "a1", "a2", "a3"]
+
+
+def test_bumped_jobs_go_first():
+    scheduler = JobScheduler()
+    for item in "abcd":
+        scheduler.push(item, batch=1)
+    scheduler.push("x", batch=2)
+    assert scheduler.bump(lambda item: item == "d", 1)
+    assert not scheduler.bump(lambda item: item == "missing", 1)
+    # the bumped job used up its batch's turn
+    assert pop_all(scheduler) == ["d", "x", "a", "b", "c"]
+
+
+def test_bumping_back_and_forth_pops_once():
+    scheduler = JobScheduler()
+    scheduler.push("a")
+    scheduler.push("b")
+    scheduler.bump(lambda item: item == "b", 2)
+    scheduler.bump(lambda item: item == "b", 0)
+    scheduler.bump(lambda item: item == "b", 1)
+    assert pop_all(scheduler) == ["b", "a"]
+    assert len(scheduler) == 0
+
+
+def test_smallest_first_and_unknown_sizes_last():
+    scheduler = JobScheduler(SMALLEST_FIRST)
+    scheduler.push("big", size=100, remaining=1)
+    scheduler.push("unknown")
+    scheduler.push("small", size=10)
+    scheduler.push("mid", size=50)
+    assert pop_all(scheduler) == ["small", "mid", "big", "unknown"]
+
+
+def test_shortest_eta_uses_remaining_bytes():
+    scheduler = JobScheduler(SHORTEST_ETA_FIRST)
+    scheduler.push("big", size=100, remaining=1)
+    scheduler.push("small", size=10)
+    assert pop_all(scheduler) == ["big", "small"]
+
+
+def test_set_policy_reorders_waiting_jobs():
+    scheduler = JobScheduler(LIST_ORDER)
+    scheduler.push("big", size=100)
+    scheduler.push("small", size=10)
+    scheduler.set_policy(SMALLEST_FIRST)
+    assert pop_all(scheduler) == ["small", "big"]
+
+
+def test_remove_all_keeps_push_order():
+    scheduler = JobScheduler()
+    scheduler.push("a", batch=1)
+    scheduler.push("b", batch=2)
+    scheduler.push("c", batch=1)
+    scheduler.bump(lambda item: item == "c", 3)
+    assert scheduler.remove_all() == ["a", "b", "c"]
+    assert not scheduler
+    try:
+        scheduler.pop()
+    except IndexError:
+        pass
+    else:
+        assert False, "popping an empty scheduler should raise"
+
+
+def test_pops_stay_fast_for_big_playlists():
+    scheduler = JobScheduler(SMALLEST_FIRST)
+    for index in range(5000):
+        scheduler.push(index, batch=index % 3, size=(index * 7919) % 10007)
+    start = time.monotonic()
+    assert len(set(pop_all(scheduler))) == 5000
+    assert time.monotonic() - start < 1
@@ -0,0 +1,125 @@
+import collections
+import io
+import os
+
+import pytest
+
+import transfer
+from transfer import IncompleteTransferError, Journal, SegmentedDownload, downloaded_bytes
+
+
+Stream = collections.namedtuple("Stream", ["url", "filesize", "itag", "default_filename"])
+
+
+class FakeResponse(io.BytesIO):
+    def __init__(self, body, length=None):
+        super().__init__(body)
+        self.length = length
+
+    def getheader(self, name, default=None):
+        if name == "Content-Length" and self.length is not None:
+            return str(self.length)
+        return default
+
+
+def test_journal_merges_ranges(tmp_path):
+    journal = Journal(str(tmp_path / "video.mp4.part.json"), "https://example.com", 100, itag=22)
+    journal.add(0, 10)
+    journal.add(20, 30)
+    journal.add(10, 20)
+    journal.add(50, 60)
+    assert journal.completed == [(0, 30), (50, 60)]
+    assert journal.missing() == [(30, 50), (60, 100)]
+
+
+def test_journal_belongs_to_a_stream_not_a_url(tmp_path):
+    path = str(tmp_path / "video.mp4.part.json")
+    journal = Journal(path, "https://example.com/old", 100, itag=22)
+    journal.add(0, 40)
+
+    resumed = Journal(path, "https://example.com/new", 100, itag=22)
+    assert resumed.load()
+    assert resumed.missing() == [(40, 100)]
+    assert not Journal(path, "https://example.com/new", 100, itag=137).load()
+    assert not Journal(path, "https://example.com/new", 200, itag=22).load()
+
+
+def test_complete_journal_is_only_committed(tmp_path, monkeypatch):
+    # killed after the last segment was journaled but before the .part file was renamed
+    def open_url(url, start=None, end=None):
+        raise AssertionError("nothing left to download")
+
+    monkeypatch.setattr(transfer, "open_url", open_url)
+    path = str(tmp_path / "video.mp4")
+    with open(path + ".part", "wb") as file_handle:
+        file_handle.write(b"x" * 100)
+    Journal(path + ".part" + Journal.suffix, "https://example.com", 100, itag=22).add(0, 100)
+
+    download = SegmentedDownload("https://example.com/new", 100, path, itag=22)
+    assert download.split([]) == []
+    assert download.run() == path
+    assert os.path.getsize(path) == 100
+    assert not os.path.exists(path + ".part") and not os.path.exists(path + ".part" + Journal.suffix)
+
+
+def test_downloaded_bytes(tmp_path):
+    path = str(tmp_path / "video.mp4")
+    assert downloaded_bytes(path, 100, 22) == 0
+
+    with open(path + ".part", "wb") as file_handle:
+        file_handle.truncate(100)
+    journal = Journal(path + ".part" + Journal.suffix, "https://example.com", 100, itag=22)
+    journal.add(0, 25)
+    journal.add(50, 60)
+    assert downloaded_bytes(path, 100, 22) == 35
+    # another stream's journal doesn't count
+    assert downloaded_bytes(path, 100, 137) == 0
+
+    os.replace(path + ".part", path)
+    journal.remove()
+    assert downloaded_bytes(path, 100, 22) == 100
+
+
+def test_truncated_body_without_ranges_isnt_committed(tmp_path, monkeypatch):
+    # the server ignored Range and the connection dropped after 40 of 100 bytes
+    monkeypatch.setattr(transfer, "open_url", lambda url, start=None, end=None: FakeResponse(b"x" * 40))
+    path = str(tmp_path / "video.mp4")
+    download = SegmentedDownload("https://example.com", 100, path)
+    download.prepare()
+    with pytest.raises(IncompleteTransferError):
+        download.fetch_whole()
+    assert download.journal.missing() == [(0, 100)]
+    assert not os.path.exists(path)
+
+
+def test_truncated_body_of_unknown_size_isnt_committed(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "content_length", lambda url: None)
+    stream = Stream("https://example.com", None, 22, "video.mp4")
+
+    monkeypatch.setattr(transfer, "open_url", lambda url, start=None, end=None: FakeResponse(b"x" * 40, 100))
+    with pytest.raises(IncompleteTransferError):
+        transfer.download_stream(stream, str(tmp_path))
+    assert not os.path.exists(str(tmp_path / "video.mp4"))
+
+    monkeypatch.setattr(transfer, "open_url", lambda url, start=None, end=None: FakeResponse(b"x" * 100, 100))
+    assert os.path.getsize(transfer.download_stream(stream, str(tmp_path))) == 100
+
+
+def test_finished_tracks_arent_downloaded_again(tmp_path, monkeypatch):
+    fetched = []
+
+    def open_url(url, start=None, end=None):
+        fetched.append(url)
+        return FakeResponse(b"a" * (end - start + 1))
+
+    monkeypatch.setattr(transfer, "open_url", open_url)
+    video = Stream("https://example.com/video", 100, 137, "video.mp4")
+    audio = Stream("https://example.com/audio", 50, 140, "video.m4a")
+    video_path, audio_path = str(tmp_path / "video.f137.mp4"), str(tmp_path / "video.f140.m4a")
+    # committed by the last attempt, whose audio track failed
+    with open(video_path, "wb") as file_handle:
+        file_handle.write(b"v" * 100)
+
+    assert transfer.download_tracks([(video, video_path), (audio, audio_path)]) == [video_path, audio_path]
+    assert fetched == ["https://example.com/audio"]
+    assert os.path.getsize(audio_path) == 50